@@ -1,4 +1,6 @@
-from typing import List
+import logging
+from functools import cached_property
+from typing import FrozenSet, List
 from pydantic_settings import BaseSettings
 from pydantic import Field, field_validator, ConfigDict
 
@@ -18,19 +20,39 @@ class Settings(BaseSettings):
 
     # Database settings
     database_url: str = Field("sqlite:///./face_recognition.db", env="DATABASE_URL")
+    sql_echo: bool = Field(False, env="SQL_ECHO")  # Логирование SQL запросов, не зависит от DEBUG
 
     # Face recognition settings
     face_recognition_threshold: float = Field(0.6, env="FACE_RECOGNITION_THRESHOLD")
     max_upload_size: int = Field(10485760, env="MAX_UPLOAD_SIZE")  # 10MB
     allowed_extensions: str = Field("jpg,jpeg,png", env="ALLOWED_EXTENSIONS")
+    preload_face_model: bool = Field(True, env="PRELOAD_FACE_MODEL")
+    vector_index_min_size: int = Field(10000, env="VECTOR_INDEX_MIN_SIZE")  # С какого числа фото включать HNSW
+    # Провайдеры ONNX Runtime в порядке приоритета, недоступные пропускаются
+    onnx_providers: str = Field("CUDAExecutionProvider,CPUExecutionProvider", env="ONNX_PROVIDERS")
+    onnx_device_id: int = Field(0, env="ONNX_DEVICE_ID")
+    # Сохранять изображения без найденного лица в uploads/debug
+    debug_save_failed_detections: bool = Field(False, env="DEBUG_SAVE_FAILED_DETECTIONS")
 
     # Paths
     upload_path: str = Field("./uploads", env="UPLOAD_PATH")
     models_cache_path: str = Field("./models_cache", env="MODELS_CACHE_PATH")
+    embedding_cache_path: str = Field("./models_cache/embeddings.db", env="EMBEDDING_CACHE_PATH")
+    vector_index_path: str = Field("./models_cache/vector_index.faiss", env="VECTOR_INDEX_PATH")
+    embedding_store_path: str = Field("./models_cache/embeddings.f32", env="EMBEDDING_STORE_PATH")
+    embedding_memory_cache_size: int = Field(1024, env="EMBEDDING_MEMORY_CACHE_SIZE")  # Записей кэша эмбеддингов в памяти
 
     # Logging
     log_level: str = Field("INFO", env="LOG_LEVEL")
 
+    @field_validator('log_level')
+    @classmethod
+    def validate_log_level(cls, v):
+        level = v.strip().upper()
+        if level not in logging.getLevelNamesMapping():
+            raise ValueError(f"Неизвестный уровень логирования: {v}")
+        return level
+
     @field_validator('allowed_extensions')
     @classmethod
     def parse_allowed_extensions(cls, v):
@@ -38,11 +60,34 @@ class Settings(BaseSettings):
             return [ext.strip().lower() for ext in v.split(',')]
         return v
 
-    def get_allowed_extensions_list(self) -> List[str]:
-        """Получить список разрешенных расширений"""
+    # Разобранный список расширений вычисляется один раз и хранится в __dict__
+    # экземпляра: чтение приватных атрибутов pydantic идет через медленный __getattr__
+    @cached_property
+    def allowed_extensions_list(self) -> List[str]:
         if isinstance(self.allowed_extensions, str):
             return [ext.strip().lower() for ext in self.allowed_extensions.split(',')]
-        return self.allowed_extensions
+        return list(self.allowed_extensions)
+
+    @cached_property
+    def allowed_extensions_set(self) -> FrozenSet[str]:
+        return frozenset(self.allowed_extensions_list)
+
+    def get_allowed_extensions_list(self) -> List[str]:
+        """Получить список разрешенных расширений"""
+        return self.allowed_extensions_list
+
+    def get_allowed_extensions_set(self) -> FrozenSet[str]:
+        """Получить множество разрешенных расширений для быстрой проверки"""
+        return self.allowed_extensions_set
+
+    def get_onnx_providers_list(self) -> List[str]:
+        """Получить список провайдеров ONNX Runtime"""
+        return [provider.strip() for provider in self.onnx_providers.split(',') if provider.strip()]
+
+    @property
+    def log_level_no(self) -> int:
+        """Числовой уровень логирования"""
+        return logging.getLevelNamesMapping()[self.log_level]
 
 
 # Глобальный экземпляр настроек
@@ -1,58 +1,120 @@
+import asyncio
+import io
+import logging
+import os
+import queue
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import orjson
+import structlog
+import uvicorn
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
-import structlog
-from contextlib import asynccontextmanager
 
-from app.config.database import create_tables
+from app.config.database import create_tables, async_engine, SessionLocal
 from app.config.settings import settings
 from app.services.face_service import face_service
+from app.services.person_service import person_service
 from app.routes import api, web
+from app.utils.exceptions import FaceRecognitionBaseException
+from app.utils.logging_queue import BatchingQueueListener, ListenerQueueHandler, QueueStream
+
+# Максимум записей лога в очереди; при переполнении запись идет синхронно
+LOG_QUEUE_SIZE = 10000
+
+# Записи лога пишутся в stderr фоновым потоком через буфер
+log_queue: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+log_listener = BatchingQueueListener(
+    log_queue, io.BufferedWriter(sys.stderr.buffer, buffer_size=8192)
+)
 
 # Настройка логирования
 structlog.configure(
     processors=[
-        structlog.stdlib.filter_by_level,
-        structlog.stdlib.add_logger_name,
-        structlog.stdlib.add_log_level,
-        structlog.stdlib.PositionalArgumentsFormatter(),
+        structlog.processors.add_log_level,
         structlog.processors.TimeStamper(fmt="iso"),
-        structlog.processors.StackInfoRenderer(),
         structlog.processors.format_exc_info,
-        structlog.processors.UnicodeDecoder(),
-        structlog.processors.JSONRenderer()
+        structlog.processors.JSONRenderer(serializer=orjson.dumps)
     ],
     context_class=dict,
-    logger_factory=structlog.stdlib.LoggerFactory(),
-    wrapper_class=structlog.stdlib.BoundLogger,
+    logger_factory=structlog.BytesLoggerFactory(file=QueueStream(log_listener)),
+    wrapper_class=structlog.make_filtering_bound_logger(settings.log_level_no),
     cache_logger_on_first_use=True,
 )
 
+# Записи стандартного logging идут через ту же очередь. Обработчики uvicorn
+# (настроены до импорта приложения) заменяются передачей в корневой логгер
+logging.getLogger().addHandler(ListenerQueueHandler(log_listener))
+for name in ("uvicorn", "uvicorn.access"):
+    logging.getLogger(name).handlers.clear()
+    logging.getLogger(name).propagate = True
+
+# SQL запросы логируются только при явно включенном SQL_ECHO
+if not settings.sql_echo:
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+
 logger = structlog.get_logger()
 
 
+def _warm_up_face_service() -> None:
+    """Загрузить и прогреть модель распознавания"""
+    face_service.initialize()
+    face_service.warm_up()
+
+
+def _preload_embeddings() -> None:
+    """Загрузить эмбеддинги активных фотографий в кэш поиска"""
+    with SessionLocal() as db:
+        person_service.preload_embeddings(db)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Управление жизненным циклом приложения"""
     # Startup
-    logger.info("Starting Face Recognition System")
-
+    log_listener.start()
     try:
-        # Создаем таблицы БД
-        create_tables()
-        logger.info("Database tables created/verified")
-
-        # Инициализируем сервис распознавания лиц
-        face_service.initialize()
-        logger.info("Face recognition service initialized")
-
-    except Exception as e:
-        logger.error("Failed to initialize services", error=str(e))
-        raise
-
-    yield
-
-    # Shutdown
-    logger.info("Shutting down Face Recognition System")
+        logger.info("Starting Face Recognition System")
+
+        # Пул потоков для инференса, чтобы не блокировать event loop
+        app.state.inference_pool = ThreadPoolExecutor(
+            max_workers=os.cpu_count(), thread_name_prefix="inference"
+        )
+
+        try:
+            # Создаем таблицы БД
+            create_tables()
+            logger.info("Database tables created/verified")
+
+            web.warm_up_templates()
+
+            # Модель загружается и прогревается до приема запросов;
+            # при PRELOAD_FACE_MODEL=False - при первом обращении к сервису
+            if settings.preload_face_model:
+                # Модель грузится в пуле инференса параллельно с загрузкой эмбеддингов из БД
+                await asyncio.gather(
+                    asyncio.get_running_loop().run_in_executor(app.state.inference_pool, _warm_up_face_service),
+                    asyncio.to_thread(_preload_embeddings)
+                )
+                logger.info("Face recognition service initialized")
+
+        except Exception as e:
+            logger.error("Failed to initialize services", error=str(e))
+            raise
+
+        yield
+
+        # Shutdown
+        logger.info("Shutting down Face Recognition System")
+        app.state.inference_pool.shutdown(wait=True)
+        person_service.save_vector_index()
+        await async_engine.dispose()
+    finally:
+        # Записи из очереди дописываются и при ошибке запуска
+        log_listener.stop()
 
 
 def create_app() -> FastAPI:
@@ -63,16 +125,26 @@ def create_app() -> FastAPI:
         description="Система распознавания лиц с использованием InsightFace",
         version="1.0.0",
         debug=settings.debug,
+        default_response_class=ORJSONResponse,
         lifespan=lifespan
     )
 
+    # Ошибки сервисов преобразуются в ответы одним обработчиком, без try/except в маршрутах.
+    # Остальные исключения API ловит middleware: обработчик Exception не дает JSON при DEBUG
+    app.add_exception_handler(FaceRecognitionBaseException, api.handle_api_error)
+    app.middleware("http")(api.handle_unexpected_errors)
+
     # Подключение маршрутов
     app.include_router(api.router)
     app.include_router(web.router)
 
-    # Статические файлы
-    app.mount("/static", StaticFiles(directory="static"), name="static")
-    app.mount("/uploads", StaticFiles(directory=settings.upload_path), name="uploads")
+    # Статические файлы. В продакшене /static и /uploads отдает nginx,
+    # а без прокси их отдают маршруты с FileResponse
+    if settings.debug:
+        app.mount("/static", StaticFiles(directory="static"), name="static")
+        app.mount("/uploads", StaticFiles(directory=settings.upload_path), name="uploads")
+    else:
+        app.include_router(web.uploads_router)
 
     return app
 
@@ -81,8 +153,6 @@ def create_app() -> FastAPI:
 app = create_app()
 
 if __name__ == "__main__":
-    import uvicorn
-
     uvicorn.run(
         "app.main:app",
         host=settings.app_host,
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, LargeBinary, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, LargeBinary, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.config.database import Base
@@ -18,6 +18,12 @@ class Person(Base):
 
 class Photo(Base):
     __tablename__ = "photos"
+    __table_args__ = (
+        # Фотографии человека с фильтром по активности
+        Index("ix_photos_person_active", "person_id", "is_active"),
+        # Покрывающий индекс для агрегатов по уверенности
+        Index("ix_photos_active_conf", "is_active", "confidence"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     person_id = Column(Integer, ForeignKey("persons.id"), nullable=False)
@@ -31,3 +37,11 @@ class Photo(Base):
 
     # Связь с человеком
     person = relationship("Person", back_populates="photos")
+
+
+class CacheVersion(Base):
+    """Счетчик изменений данных, кэшируемых в памяти воркеров"""
+    __tablename__ = "cache_versions"
+
+    name = Column(String(100), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
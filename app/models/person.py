@@ -1,6 +1,6 @@
 from typing import Optional, List
 from datetime import datetime
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class PersonBase(BaseModel):
@@ -24,53 +24,40 @@ class PhotoBase(BaseModel):
 
 class PhotoCreate(PhotoBase):
     person_id: int
-    embedding_vector: Optional[List[float]] = None
+    embedding_vector: Optional[bytes] = None  # байты эмбеддинга в float16
 
 
 class Photo(PhotoBase):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     person_id: int
     created_at: datetime
     updated_at: datetime
 
-    class Config:
-        from_attributes = True
-
 
 class Person(PersonBase):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     created_at: datetime
     updated_at: datetime
 
-    class Config:
-        from_attributes = True
-
 
 class PersonWithPhotos(Person):
-    photos: List[Photo] = []
+    model_config = ConfigDict(from_attributes=True)
 
-    class Config:
-        from_attributes = True
+    photos: List[Photo] = []
 
 
 class IdentificationResult(BaseModel):
     person_id: Optional[int] = None
     person_name: Optional[str] = None
     confidence: float = Field(0.0, ge=0.0, le=1.0)
-    similarity: float = Field(0.0, ge=0.0)  # Убираем верхний предел
+    similarity: float = Field(0.0, ge=0.0, le=1.0)
     is_match: bool = False
     photo_id: Optional[int] = None
 
-    @field_validator('similarity', 'confidence')
-    @classmethod
-    def clamp_values(cls, v):
-        """Обрезаем значения до разумных пределов"""
-        if v > 1.0:
-            return 1.0
-        elif v < 0.0:
-            return 0.0
-        return v
-
 
 class PersonStats(BaseModel):
     total_photos: int
@@ -1,11 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy import text
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File, Form
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import case, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from pathlib import Path
+import asyncio
 import structlog
 
-from app.config.database import get_db
+from app.config.database import get_db, get_async_db
 from app.config.settings import settings
 from app.models.person import (
     Person, PersonCreate, PersonUpdate, PersonWithPhotos,
@@ -18,89 +21,118 @@ from app.utils.validators import (
     validate_upload_request, validate_identification_request, PersonValidator
 )
 from app.utils.exceptions import (
-    FileValidationError, FileStorageError, FaceDetectionError,
-    PersonNotFoundError, ValidationError
+    FaceRecognitionBaseException, FileValidationError, FileStorageError,
+    FaceDetectionError, PersonNotFoundError, ValidationError
 )
 
 logger = structlog.get_logger()
 
 router = APIRouter(prefix="/api", tags=["api"])
 
+# Максимум файлов в одной пакетной загрузке
+MAX_BATCH_UPLOAD_FILES = 20
 
-async def handle_api_error(e: Exception) -> HTTPException:
-    """Обработчик ошибок API"""
-    if isinstance(e, (FileValidationError, ValidationError)):
-        return HTTPException(status_code=400, detail={
-            'error': str(e),
-            'error_type': 'validation_error'
-        })
+# Сходство, начиная с которого фото считается повторной загрузкой.
+# Чуть меньше 1.0: эмбеддинги хранятся в float16
+DUPLICATE_SIMILARITY = 0.99999
 
-    elif isinstance(e, PersonNotFoundError):
-        return HTTPException(status_code=404, detail={
-            'error': str(e),
-            'error_type': 'not_found'
-        })
 
-    elif isinstance(e, (FileStorageError, FaceDetectionError)):
-        return HTTPException(status_code=422, detail={
-            'error': str(e),
-            'error_type': 'processing_error'
-        })
+# Соответствие типов исключений HTTP статусу и типу ошибки
+_ERROR_MAP = {
+    FileValidationError: (400, 'validation_error'),
+    ValidationError: (400, 'validation_error'),
+    PersonNotFoundError: (404, 'not_found'),
+    FileStorageError: (422, 'processing_error'),
+    FaceDetectionError: (422, 'processing_error'),
+}
 
-    else:
-        logger.error("Unexpected API error", error=str(e), error_type=type(e).__name__)
-        return HTTPException(status_code=500, detail={
-            'error': 'Внутренняя ошибка сервера',
-            'error_type': 'internal_error'
-        })
+
+def _lookup_error(exc: Exception) -> Tuple[int, str]:
+    """HTTP статус и тип ошибки для исключения
+
+    Классы перебираются по MRO, поэтому подклассы получают ответ базового
+    класса; для самого частого случая хватает первой же проверки.
+    """
+    for exc_type in type(exc).__mro__:
+        entry = _ERROR_MAP.get(exc_type)
+        if entry is not None:
+            return entry
+    return 500, 'internal_error'
+
+
+def internal_error_response(exc: Exception) -> ORJSONResponse:
+    """Записать непредвиденную ошибку в лог и вернуть ответ 500"""
+    logger.error("Unexpected API error", error=str(exc), error_type=type(exc).__name__)
+    return ORJSONResponse(status_code=500, content={'detail': {
+        'error': 'Внутренняя ошибка сервера',
+        'error_type': 'internal_error'
+    }})
+
+
+async def handle_api_error(request: Request, exc: FaceRecognitionBaseException) -> ORJSONResponse:
+    """Обработчик ошибок сервисов, регистрируется на приложении
+
+    Объявлен async, чтобы Starlette не переносил вызов в пул потоков.
+    """
+    status_code, error_type = _lookup_error(exc)
+    if status_code == 500:
+        return internal_error_response(exc)
+
+    return ORJSONResponse(status_code=status_code, content={'detail': {
+        'error': str(exc),
+        'error_type': error_type
+    }})
+
+
+async def handle_unexpected_errors(request: Request, call_next):
+    """Middleware: остальные исключения маршрутов API - в тот же JSON ответ 500
+
+    Обработчик Exception в Starlette вызывается из ServerErrorMiddleware: при
+    DEBUG=True он отдает HTML страницу с трассировкой, а иначе повторно
+    выбрасывает исключение, и сервер пишет трассировку еще раз.
+    """
+    try:
+        return await call_next(request)
+    except Exception as exc:
+        if not request.url.path.startswith(router.prefix):
+            raise
+        return internal_error_response(exc)
 
 
 @router.post("/persons", response_model=Person)
 async def create_person(person_data: PersonCreate, db: Session = Depends(get_db)):
     """Создать нового человека"""
-    try:
-        # Валидация имени
-        validation_result = PersonValidator.validate_person_name(person_data.name)
-        if not validation_result['is_valid']:
-            raise ValidationError('; '.join(validation_result['errors']))
+    # Валидация имени
+    validation_result = PersonValidator.validate_person_name(person_data.name)
+    if not validation_result.is_valid:
+        raise ValidationError('; '.join(validation_result.errors))
 
-        person = person_service.create_person(db, person_data)
-        return person
-
-    except Exception as e:
-        raise await handle_api_error(e)
+    person = person_service.create_person(db, person_data)
+    return person
 
 
 @router.get("/persons", response_model=List[Person])
 async def get_all_persons(
         limit: int = 50,
         offset: int = 0,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Получить список всех людей"""
-    try:
-        limit = min(max(limit, 1), 100)  # Ограничиваем от 1 до 100
-        offset = max(offset, 0)
+    limit = min(max(limit, 1), 100)  # Ограничиваем от 1 до 100
+    offset = max(offset, 0)
 
-        persons = person_service.get_all_persons(db, limit, offset)
-        return persons
-
-    except Exception as e:
-        raise await handle_api_error(e)
+    persons = await db.run_sync(person_service.get_all_persons, limit, offset)
+    return persons
 
 
 @router.get("/persons/{person_id}", response_model=PersonWithPhotos)
-async def get_person(person_id: int, db: Session = Depends(get_db)):
+async def get_person(person_id: int, db: AsyncSession = Depends(get_async_db)):
     """Получить информацию о человеке"""
-    try:
-        person = person_service.get_person_with_photos(db, person_id)
-        if not person:
-            raise PersonNotFoundError(f'Человек с ID {person_id} не найден')
+    person = await db.run_sync(person_service.get_person_with_photos, person_id)
+    if not person:
+        raise PersonNotFoundError(f'Человек с ID {person_id} не найден')
 
-        return person
-
-    except Exception as e:
-        raise await handle_api_error(e)
+    return person
 
 
 @router.put("/persons/{person_id}", response_model=Person)
@@ -110,110 +142,187 @@ async def update_person(
         db: Session = Depends(get_db)
 ):
     """Обновить информацию о человеке"""
-    try:
-        # Валидация имени (если передано)
-        if person_data.name is not None:
-            validation_result = PersonValidator.validate_person_name(person_data.name)
-            if not validation_result['is_valid']:
-                raise ValidationError('; '.join(validation_result['errors']))
+    # Валидация имени (если передано)
+    if person_data.name is not None:
+        validation_result = PersonValidator.validate_person_name(person_data.name)
+        if not validation_result.is_valid:
+            raise ValidationError('; '.join(validation_result.errors))
 
-        person = person_service.update_person(db, person_id, person_data)
-        if not person:
-            raise PersonNotFoundError(f'Человек с ID {person_id} не найден')
+    person = person_service.update_person(db, person_id, person_data)
+    if not person:
+        raise PersonNotFoundError(f'Человек с ID {person_id} не найден')
 
-        return person
-
-    except Exception as e:
-        raise await handle_api_error(e)
+    return person
 
 
 @router.delete("/persons/{person_id}")
 async def delete_person(person_id: int, db: Session = Depends(get_db)):
     """Удалить человека"""
-    try:
-        deleted = person_service.delete_person(db, person_id)
-        if not deleted:
-            raise PersonNotFoundError(f'Человек с ID {person_id} не найден')
+    deleted = person_service.delete_person(db, person_id)
+    if not deleted:
+        raise PersonNotFoundError(f'Человек с ID {person_id} не найден')
 
-        return {"message": "Человек успешно удален"}
-
-    except Exception as e:
-        raise await handle_api_error(e)
+    return {"message": "Человек успешно удален"}
 
 
 @router.post("/persons/{person_id}/photos")
 async def upload_photo(
         person_id: int,
+        request: Request,
         file: UploadFile = File(...),
         db: Session = Depends(get_db)
 ):
     """Загрузить фотографию для человека"""
-    try:
-        # Проверяем существование человека
-        person = person_service.get_person(db, person_id)
-        if not person:
-            raise PersonNotFoundError(f'Человек с ID {person_id} не найден')
-
-        # Читаем файл
-        file_data = await file.read()
-
-        # Валидация запроса
-        validation_result = validate_upload_request(file.filename, len(file_data), person_id)
-        if not validation_result['is_valid']:
-            raise ValidationError('; '.join(validation_result['errors']))
-
-        # Сохраняем файл
-        file_info = await file_service.save_uploaded_file(
-            file_data, file.filename, person_id=person_id
-        )
-
-        # Получаем эмбеддинг лица
-        embedding, confidence = face_service.get_face_embedding(file_info['file_path'])
-
-        # Сохраняем фотографию в БД
-        photo = person_service.add_photo_to_person(
-            db=db,
-            person_id=person_id,
-            filename=file_info['filename'],
-            file_path=file_info['relative_path'],
-            embedding_vector=embedding.tolist(),
-            confidence=confidence
-        )
-
-        if not photo:
-            # Удаляем файл если не удалось сохранить в БД
-            await file_service.delete_file(file_info['file_path'])
-            raise FileStorageError('Не удалось сохранить фотографию в базе данных')
-
-        return {
-            "photo_id": photo.id,
-            "filename": photo.filename,
-            "confidence": photo.confidence,
-            "person_id": photo.person_id,
-            "created_at": photo.created_at
-        }
+    # Проверяем существование человека
+    person = person_service.get_person(db, person_id)
+    if not person:
+        raise PersonNotFoundError(f'Человек с ID {person_id} не найден')
+
+    # Валидация запроса (размер известен после разбора multipart)
+    validation_result = validate_upload_request(file.filename, file.size, person_id)
+    if not validation_result.is_valid:
+        raise ValidationError('; '.join(validation_result.errors))
+
+    # Сохраняем файл
+    file_info = await file_service.save_uploaded_file(file, person_id=person_id)
+
+    # Получаем эмбеддинг лица в пуле инференса, не блокируя event loop
+    embedding, confidence = await asyncio.get_running_loop().run_in_executor(
+        request.app.state.inference_pool,
+        face_service.get_face_embedding,
+        file_info['file_path'],
+        file_info['file_hash']
+    )
+
+    # Сохраняем фотографию в БД
+    photo = person_service.add_photo_to_person(
+        db=db,
+        person_id=person_id,
+        filename=file_info['filename'],
+        file_path=file_info['relative_path'],
+        embedding_vector=embedding,
+        confidence=confidence
+    )
+
+    if not photo:
+        # Удаляем файл если не удалось сохранить в БД
+        file_service.delete_file(file_info['file_path'])
+        raise FileStorageError('Не удалось сохранить фотографию в базе данных')
+
+    return {
+        "photo_id": photo.id,
+        "filename": photo.filename,
+        "confidence": photo.confidence,
+        "person_id": photo.person_id,
+        "created_at": photo.created_at
+    }
+
+
+@router.post("/persons/{person_id}/photos:batch")
+async def upload_photos_batch(
+        person_id: int,
+        request: Request,
+        files: List[UploadFile] = File(...),
+        db: Session = Depends(get_db)
+):
+    """Загрузить несколько фотографий для человека за один запрос"""
+    # Проверяем существование человека
+    person = person_service.get_person(db, person_id)
+    if not person:
+        raise PersonNotFoundError(f'Человек с ID {person_id} не найден')
+
+    if len(files) > MAX_BATCH_UPLOAD_FILES:
+        raise ValidationError(f'Слишком много файлов (максимум {MAX_BATCH_UPLOAD_FILES})')
+
+    # Валидация всех файлов до сохранения
+    for file in files:
+        validation_result = validate_upload_request(file.filename, file.size, person_id)
+        if not validation_result.is_valid:
+            raise ValidationError(f"{file.filename}: {'; '.join(validation_result.errors)}")
+
+    # Сохраняем файлы параллельно
+    saved = await asyncio.gather(
+        *(file_service.save_uploaded_file(file, person_id=person_id) for file in files),
+        return_exceptions=True
+    )
+    failed = [result for result in saved if isinstance(result, Exception)]
+    if failed:
+        for result in saved:
+            if not isinstance(result, Exception):
+                file_service.delete_file(result['file_path'])
+        raise failed[0]
+
+    # Повторы одного и того же файла внутри пакета не сохраняем
+    unique_files, duplicates, seen_hashes = [], [], set()
+    for file_info in saved:
+        if file_info['file_hash'] in seen_hashes:
+            duplicates.append(file_info['original_filename'])
+            file_service.delete_file(file_info['file_path'])
+        else:
+            seen_hashes.add(file_info['file_hash'])
+            unique_files.append(file_info)
+
+    # Эмбеддинги всех файлов за один вызов в пуле инференса
+    embeddings = await asyncio.get_running_loop().run_in_executor(
+        request.app.state.inference_pool,
+        face_service.get_face_embeddings_batch,
+        [file_info['file_path'] for file_info in unique_files],
+        [file_info['file_hash'] for file_info in unique_files]
+    )
+
+    rows, stored_files, errors = [], [], []
+    for file_info, result in zip(unique_files, embeddings):
+        if result['error']:
+            errors.append({'filename': file_info['original_filename'], 'error': result['error']})
+            file_service.delete_file(file_info['file_path'])
+            continue
+
+        stored_files.append(file_info)
+        rows.append({
+            'filename': file_info['filename'],
+            'file_path': file_info['relative_path'],
+            'embedding_vector': result['embedding'],
+            'confidence': result['confidence']
+        })
 
-    except Exception as e:
-        raise await handle_api_error(e)
+    # Все фотографии сохраняются одной транзакцией
+    try:
+        photos = person_service.add_photos_to_person(db, person_id, rows) if rows else []
+    except Exception:
+        for file_info in stored_files:
+            file_service.delete_file(file_info['file_path'])
+        raise
+
+    return {
+        "photos": [
+            {
+                "photo_id": photo.id,
+                "filename": photo.filename,
+                "confidence": photo.confidence,
+                "person_id": photo.person_id,
+                "created_at": photo.created_at
+            }
+            for photo in photos
+        ],
+        "duplicates": duplicates,
+        "errors": errors
+    }
 
 
 @router.delete("/photos/{photo_id}")
 async def delete_photo(photo_id: int, db: Session = Depends(get_db)):
     """Удалить фотографию"""
-    try:
-        file_path = person_service.delete_photo(db, photo_id)
-        if not file_path:
-            raise HTTPException(status_code=404, detail="Фотография не найдена")
+    file_path = person_service.delete_photo(db, photo_id)
+    if not file_path:
+        raise HTTPException(status_code=404, detail="Фотография не найдена")
 
-        await file_service.delete_file(str(Path(settings.upload_path) / file_path))
-        return {"message": "Фотография удалена"}
-
-    except Exception as e:
-        raise await handle_api_error(e)
+    file_service.delete_file(str(Path(settings.upload_path) / file_path))
+    return {"message": "Фотография удалена"}
 
 
 @router.post("/identify", response_model=IdentificationResult)
 async def identify_person(
+        request: Request,
         file: UploadFile = File(...),
         person_id: Optional[int] = Form(None),
         create_new: bool = Form(False),
@@ -225,126 +334,124 @@ async def identify_person(
         person_id: ID человека для привязки фото, если лицо не распознано.
         create_new: Создать нового человека, если совпадение не найдено.
     """
-    try:
-        # Читаем файл
-        file_data = await file.read()
+    # Валидация запроса
+    validation_result = validate_upload_request(file.filename, file.size)
+    if not validation_result.is_valid:
+        raise ValidationError('; '.join(validation_result.errors))
 
-        # Валидация запроса
-        validation_result = validate_upload_request(file.filename, len(file_data))
-        if not validation_result['is_valid']:
-            raise ValidationError('; '.join(validation_result['errors']))
+    # Сохраняем временный файл
+    file_info = await file_service.save_uploaded_file(file, temp=True)
+    temp_promoted = False
 
-        # Сохраняем временный файл
-        file_info = await file_service.save_uploaded_file(
-            file_data, file.filename, temp=True
+    try:
+        # Валидация изображения для идентификации
+        image_validation = validate_identification_request(file_info['file_path'])
+        if not image_validation.is_valid:
+            raise ValidationError('; '.join(image_validation.errors))
+
+        # Выполняем идентификацию и получаем эмбеддинг в пуле инференса
+        result, embedding = await asyncio.get_running_loop().run_in_executor(
+            request.app.state.inference_pool,
+            person_service.identify_person,
+            db,
+            file_info['file_path'],
+            file_info['file_hash']
         )
 
-        try:
-            # Валидация изображения для идентификации
-            image_validation = validate_identification_request(file_info['file_path'])
-            if not image_validation['is_valid']:
-                raise ValidationError('; '.join(image_validation['errors']))
-
-            # Выполняем идентификацию и получаем эмбеддинг
-            result, embedding = person_service.identify_person(db, file_info['file_path'])
-
-            # Убираем данные о человеке, если совпадение не найдено
-            if not result.is_match:
-                result.person_id = None
-                result.person_name = None
-
-            # Определяем ID человека для сохранения
-            target_person_id = result.person_id if result.is_match else person_id
-
-            # Создаем нового человека только при явном запросе
-            if create_new and not target_person_id:
-                new_person = person_service.create_person(
-                    db, PersonCreate(name="Не задан")
-                )
-                target_person_id = new_person.id
-                result = IdentificationResult(
-                    person_id=new_person.id,
-                    person_name=new_person.name,
-                    confidence=result.confidence,
-                    similarity=1.0,
-                    is_match=True
-                )
-
-            if target_person_id:
-                # Проверяем, не является ли загруженная фотография точной копией
-                is_duplicate = (
-                    result.is_match and
-                    result.photo_id is not None and
-                    result.similarity >= 1.0
+        # Убираем данные о человеке, если совпадение не найдено
+        if not result.is_match:
+            result.person_id = None
+            result.person_name = None
+
+        # Определяем ID человека для сохранения
+        target_person_id = result.person_id if result.is_match else person_id
+
+        # Создаем нового человека только при явном запросе
+        if create_new and not target_person_id:
+            new_person = person_service.create_person(
+                db, PersonCreate(name="Не задан")
+            )
+            target_person_id = new_person.id
+            result = IdentificationResult(
+                person_id=new_person.id,
+                person_name=new_person.name,
+                confidence=result.confidence,
+                similarity=1.0,
+                is_match=True
+            )
+
+        if target_person_id:
+            # Проверяем, не является ли загруженная фотография точной копией
+            is_duplicate = (
+                result.is_match and
+                result.photo_id is not None and
+                result.similarity >= DUPLICATE_SIMILARITY
+            )
+
+            if not is_duplicate:
+                # Перемещаем уже проверенный временный файл в постоянное хранилище
+                saved_file = file_service.promote_temp_to_person(
+                    file_info, person_id=target_person_id
                 )
+                temp_promoted = True
 
-                if not is_duplicate:
-                    # Сохраняем файл в постоянное хранилище
-                    saved_file = await file_service.save_uploaded_file(
-                        file_data, file.filename, person_id=target_person_id
-                    )
-
-                    # Сохраняем фото и эмбеддинг в БД
+                # Сохраняем фото и эмбеддинг в БД
+                try:
                     photo = person_service.add_photo_to_person(
                         db=db,
                         person_id=target_person_id,
                         filename=saved_file['filename'],
                         file_path=saved_file['relative_path'],
-                        embedding_vector=embedding.tolist(),
+                        embedding_vector=embedding,
                         confidence=result.confidence
                     )
+                except Exception:
+                    file_service.delete_file(saved_file['file_path'])
+                    raise
+
+                # Добавляем ID сохранённого фото в результат, если ранее не было
+                if result.photo_id is None and photo is not None:
+                    result.photo_id = photo.id
+            else:
+                logger.info(
+                    "Duplicate photo detected, skipping save",
+                    person_id=target_person_id,
+                    photo_id=result.photo_id
+                )
 
-                    # Добавляем ID сохранённого фото в результат, если ранее не было
-                    if result.photo_id is None and photo is not None:
-                        result.photo_id = photo.id
-                else:
-                    logger.info(
-                        "Duplicate photo detected, skipping save",
-                        person_id=target_person_id,
-                        photo_id=result.photo_id
-                    )
-
-            return result
-
-        finally:
-            # Удаляем временный файл
-            await file_service.delete_file(file_info['file_path'])
+        return result
 
-    except Exception as e:
-        raise await handle_api_error(e)
+    finally:
+        # Удаляем временный файл, если он не был перемещен в хранилище
+        if not temp_promoted:
+            file_service.delete_file(file_info['file_path'])
 
 
 @router.get("/persons/{person_id}/stats", response_model=PersonStats)
-async def get_person_stats(person_id: int, db: Session = Depends(get_db)):
+async def get_person_stats(person_id: int, db: AsyncSession = Depends(get_async_db)):
     """Получить статистику по человеку"""
-    try:
-        # Проверяем существование человека
-        person = person_service.get_person(db, person_id)
-        if not person:
-            raise PersonNotFoundError(f'Человек с ID {person_id} не найден')
+    # Проверяем существование человека
+    person = await db.run_sync(person_service.get_person, person_id)
+    if not person:
+        raise PersonNotFoundError(f'Человек с ID {person_id} не найден')
 
-        stats = person_service.get_person_stats(db, person_id)
-        return PersonStats(**stats)
-
-    except Exception as e:
-        raise await handle_api_error(e)
+    stats = await db.run_sync(person_service.get_person_stats, person_id)
+    return PersonStats(**stats)
 
 
 @router.get("/health")
-async def health_check(db: Session = Depends(get_db)):
+async def health_check(db: AsyncSession = Depends(get_async_db)):
     """Проверка состояния системы"""
     try:
-        # Проверяем инициализацию Face ID сервиса
-        if not face_service._initialized:
-            face_service.initialize()
-
         # Проверяем подключение к БД
-        db.execute(text("SELECT 1"))
+        await db.execute(text("SELECT 1"))
 
+        # Модель загружается в lifespan, здесь только проверяется ее состояние
+        model_ready = face_service._initialized
         return {
-            "status": "healthy",
+            "status": "healthy" if model_ready else "degraded",
             "services": {
-                "face_recognition": "ok",
+                "face_recognition": "ok" if model_ready else "not_loaded",
                 "database": "ok"
             }
         }
@@ -358,33 +465,24 @@ async def health_check(db: Session = Depends(get_db)):
 
 
 @router.get("/stats")
-async def get_system_stats(db: Session = Depends(get_db)):
+async def get_system_stats(db: AsyncSession = Depends(get_async_db)):
     """Получить статистику системы"""
-    try:
-        from app.models.database import Person as PersonDB, Photo as PhotoDB
-
-        total_persons = db.query(PersonDB).count()
-        active_photos = db.query(PhotoDB).filter(PhotoDB.is_active == True).count()
-        inactive_photos = db.query(PhotoDB).filter(PhotoDB.is_active == False).count()
-
-        # Средняя уверенность
-        avg_confidence_result = db.query(PhotoDB.confidence).filter(
-            PhotoDB.is_active == True
-        ).all()
-
-        avg_confidence = 0.0
-        if avg_confidence_result:
-            confidences = [r[0] for r in avg_confidence_result if r[0] is not None]
-            if confidences:
-                avg_confidence = sum(confidences) / len(confidences)
-
-        return {
-            "total_persons": total_persons,
-            "active_photos": active_photos,
-            "inactive_photos": inactive_photos,
-            "avg_confidence": avg_confidence,
-            "face_recognition_threshold": settings.face_recognition_threshold
-        }
-
-    except Exception as e:
-        raise await handle_api_error(e)
\ No newline at end of file
+    from app.models.database import Person as PersonDB, Photo as PhotoDB
+
+    # Вся статистика считается одним запросом
+    total_persons, active_photos, inactive_photos, avg_confidence = (await db.execute(
+        select(
+            select(func.count(PersonDB.id)).scalar_subquery(),
+            func.count(case((PhotoDB.is_active == True, 1))),
+            func.count(case((PhotoDB.is_active == False, 1))),
+            func.avg(case((PhotoDB.is_active == True, PhotoDB.confidence)))
+        ).select_from(PhotoDB)
+    )).one()
+
+    return {
+        "total_persons": total_persons,
+        "active_photos": active_photos,
+        "inactive_photos": inactive_photos,
+        "avg_confidence": avg_confidence or 0.0,
+        "face_recognition_threshold": settings.face_recognition_threshold
+    }
\ No newline at end of file
@@ -1,18 +1,39 @@
 from fastapi import APIRouter, Request, Depends, HTTPException
-from fastapi.encoders import jsonable_encoder
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from jinja2 import FileSystemBytecodeCache
+from fastapi.responses import HTMLResponse, FileResponse
+from sqlalchemy import case, distinct, func, select
 from sqlalchemy.orm import Session
+from pathlib import Path
 import structlog
 
 from app.config.database import get_db
+from app.config.settings import settings
 from app.services.person_service import person_service
 from app.models.person import PersonStats
 
 logger = structlog.get_logger()
 
 router = APIRouter(tags=["web"])
-templates = Jinja2Templates(directory="templates")
+uploads_router = APIRouter(tags=["web"])
+# Вне режима отладки шаблоны компилируются один раз, без проверки mtime на каждый запрос.
+# Скомпилированный байткод сохраняется на диск и переиспользуется новыми воркерами
+templates = Jinja2Templates(
+    directory="templates",
+    auto_reload=settings.debug,
+    cache_size=400,
+    bytecode_cache=FileSystemBytecodeCache()
+)
+uploads_root = Path(settings.upload_path).resolve()
+static_root = Path("static").resolve()
+
+
+def warm_up_templates() -> int:
+    """Скомпилировать все шаблоны заранее, чтобы первый запрос не ждал компиляции"""
+    names = templates.env.list_templates(extensions=["html"])
+    for name in names:
+        templates.env.get_template(name)
+    return len(names)
 
 
 @router.get("/", response_class=HTMLResponse)
@@ -30,7 +51,7 @@ async def upload_page(request: Request, db: Session = Depends(get_db)):
     """Страница загрузки фотографий"""
     try:
         # Получаем список всех людей для выбора
-        persons = person_service.get_all_persons(db, limit=1000)
+        persons = person_service.get_all_persons_cached(db)
 
         return templates.TemplateResponse("upload.html", {
             "request": request,
@@ -53,8 +74,7 @@ async def upload_page(request: Request, db: Session = Depends(get_db)):
 async def identify_page(request: Request, db: Session = Depends(get_db)):
     """Страница идентификации"""
     try:
-        persons = person_service.get_all_persons(db, limit=1000)
-        persons_data = jsonable_encoder(persons)
+        persons_data = person_service.get_all_persons_json_cached(db)
     except Exception as e:
         logger.error("Failed to load persons for identify page", error=str(e))
         persons_data = []
@@ -89,14 +109,15 @@ async def persons_list_page(
 
         has_prev = page > 1
 
-        # Получаем статистику для каждого человека
-        persons_with_stats = []
-        for person in persons:
-            stats_data = person_service.get_person_stats(db, person.id)
-            persons_with_stats.append({
+        # Получаем статистику для всех людей страницы одним запросом
+        stats_by_id = person_service.get_stats_for_ids(db, [person.id for person in persons])
+        persons_with_stats = [
+            {
                 'person': person,
-                'stats': PersonStats(**stats_data)
-            })
+                'stats': PersonStats(**stats_by_id[person.id])
+            }
+            for person in persons
+        ]
 
         return templates.TemplateResponse("persons_list.html", {
             "request": request,
@@ -131,7 +152,7 @@ async def person_detail_page(
 ):
     """Страница детальной информации о человеке"""
     try:
-        person = person_service.get_person_with_photos(db, person_id)
+        person, stats = person_service.get_person_with_photos_and_stats(db, person_id)
         if not person:
             return templates.TemplateResponse("person_detail.html", {
                 "request": request,
@@ -141,8 +162,6 @@ async def person_detail_page(
                 "person": None
             })
 
-        stats = person_service.get_person_stats(db, person_id)
-
         return templates.TemplateResponse("person_detail.html", {
             "request": request,
             "title": f"Информация о {person.name}",
@@ -177,44 +196,33 @@ async def training_page(request: Request, db: Session = Depends(get_db)):
         # Импортируем модели локально, чтобы избежать проблем с импортом
         from app.models.database import Person as PersonDB, Photo as PhotoDB
 
-        # Получаем статистику системы
-        total_persons = db.query(PersonDB).count()
-        active_photos = db.query(PhotoDB).filter(PhotoDB.is_active == True).count()
-        inactive_photos = db.query(PhotoDB).filter(PhotoDB.is_active == False).count()
-
-        # Средняя уверенность
-        avg_confidence_result = db.query(PhotoDB.confidence).filter(
-            PhotoDB.is_active == True
+        # Вся статистика системы считается одним запросом
+        total_persons, active_photos, inactive_photos, avg_confidence, persons_with_photos = db.execute(
+            select(
+                select(func.count(PersonDB.id)).scalar_subquery(),
+                func.count(case((PhotoDB.is_active == True, 1))),
+                func.count(case((PhotoDB.is_active == False, 1))),
+                func.avg(case((PhotoDB.is_active == True, PhotoDB.confidence))),
+                func.count(distinct(case((PhotoDB.is_active == True, PhotoDB.person_id))))
+            ).select_from(PhotoDB)
+        ).one()
+
+        # Последние добавленные фотографии выбираются колонками, без загрузки ORM объектов;
+        # строки передаются в шаблон как есть, дата форматируется при рендеринге
+        recent_photos = db.execute(
+            select(
+                PhotoDB.id,
+                PhotoDB.filename,
+                PhotoDB.confidence,
+                PhotoDB.created_at,
+                PersonDB.name.label('person_name')
+            ).join(
+                PersonDB, PhotoDB.person_id == PersonDB.id
+            ).where(
+                PhotoDB.is_active == True
+            ).order_by(PhotoDB.created_at.desc()).limit(10)
         ).all()
 
-        avg_confidence = 0.0
-        if avg_confidence_result:
-            confidences = [r[0] for r in avg_confidence_result if r[0] is not None]
-            if confidences:
-                avg_confidence = sum(confidences) / len(confidences)
-
-        # Количество людей с фотографиями
-        persons_with_photos = db.query(PhotoDB.person_id).filter(
-            PhotoDB.is_active == True
-        ).distinct().count()
-
-        # Получаем последние добавленные фотографии
-        recent_photos_query = db.query(PhotoDB, PersonDB.name).join(
-            PersonDB, PhotoDB.person_id == PersonDB.id
-        ).filter(
-            PhotoDB.is_active == True
-        ).order_by(PhotoDB.created_at.desc()).limit(10).all()
-
-        recent_photos = []
-        for photo, person_name in recent_photos_query:
-            recent_photos.append({
-                'id': photo.id,
-                'filename': photo.filename,
-                'confidence': photo.confidence,
-                'created_at': photo.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                'person_name': person_name
-            })
-
         return templates.TemplateResponse("training.html", {
             "request": request,
             "title": "Управление обучением",
@@ -222,7 +230,7 @@ async def training_page(request: Request, db: Session = Depends(get_db)):
                 'total_persons': total_persons,
                 'active_photos': active_photos,
                 'inactive_photos': inactive_photos,
-                'avg_confidence': avg_confidence,
+                'avg_confidence': avg_confidence or 0.0,
                 'persons_with_photos': persons_with_photos
             },
             "recent_photos": recent_photos,
@@ -253,9 +261,8 @@ async def results_page(
     if person_id:
         try:
             # Получаем дополнительную информацию о найденном человеке
-            person = person_service.get_person_with_photos(db, person_id)
+            person, stats = person_service.get_person_with_photos_and_stats(db, person_id)
             if person:
-                stats = person_service.get_person_stats(db, person_id)
                 result_data = {
                     'person': person,
                     'stats': stats,
@@ -275,4 +282,24 @@ async def results_page(
         "confidence": confidence,
         "person_name": person_name,
         "page": "results"
-    })
\ No newline at end of file
+    })
+
+
+@uploads_router.get("/static/{path:path}", name="static", include_in_schema=False)
+async def static_file(path: str):
+    """Отдать статический файл, если перед приложением нет nginx"""
+    file_path = (static_root / path).resolve()
+    if not file_path.is_relative_to(static_root) or not file_path.is_file():
+        raise HTTPException(status_code=404, detail="Файл не найден")
+
+    return FileResponse(file_path)
+
+
+@uploads_router.get("/uploads/{file_path:path}", include_in_schema=False)
+async def uploaded_file(file_path: str):
+    """Отдать загруженный файл, если перед приложением нет nginx"""
+    path = (uploads_root / file_path).resolve()
+    if not path.is_relative_to(uploads_root) or not path.is_file():
+        raise HTTPException(status_code=404, detail="Файл не найден")
+
+    return FileResponse(path)
@@ -0,0 +1,104 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+import structlog
+
+from app.config.settings import settings
+
+logger = structlog.get_logger()
+
+
+class EmbeddingCache:
+    """Кэш эмбеддингов лиц по хэшу содержимого файла
+
+    Ключ - имя модели и BLAKE3 хэш изображения, поэтому повторная загрузка
+    того же файла не требует запуска модели. Хранится в отдельной SQLite базе,
+    последние использованные записи дополнительно держатся в памяти (LRU).
+    """
+
+    def __init__(self, db_path: str, memory_size: int = 1024):
+        self.db_path = Path(db_path)
+        self.memory_size = memory_size
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[np.ndarray, float]]" = OrderedDict()
+
+    def _remember(self, key: str, value: Tuple[np.ndarray, float]) -> None:
+        """Добавить запись в LRU в памяти (под блокировкой)"""
+        if self.memory_size <= 0:
+            return
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Открыть базу кэша при первом обращении"""
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, embedding BLOB NOT NULL, confidence REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def make_key(model_name: str, file_hash: str) -> str:
+        """Ключ кэша с пространством имен модели"""
+        return f"{model_name}:{file_hash}"
+
+    def get(self, key: str) -> Optional[Tuple[np.ndarray, float]]:
+        """Получить эмбеддинг и уверенность детекции по ключу"""
+        try:
+            with self._lock:
+                cached = self._memory.get(key)
+                if cached is not None:
+                    self._memory.move_to_end(key)
+                    return cached
+
+                row = self._connect().execute(
+                    "SELECT embedding, confidence FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+
+                cached = np.frombuffer(row[0], dtype=np.float32), row[1]
+                self._remember(key, cached)
+                return cached
+        except sqlite3.Error as e:
+            logger.warning("Embedding cache read failed", error=str(e))
+            return None
+
+    def put(self, key: str, embedding: np.ndarray, confidence: float) -> None:
+        """Сохранить эмбеддинг и уверенность детекции"""
+        # Копия, чтобы запись в памяти не удерживала весь массив пакета, из которого взята строка
+        embedding = np.array(embedding, dtype=np.float32)
+        try:
+            with self._lock:
+                self._remember(key, (embedding, float(confidence)))
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, embedding, confidence) VALUES (?, ?, ?)",
+                    (key, embedding.tobytes(), float(confidence))
+                )
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.warning("Embedding cache write failed", error=str(e))
+
+    def close(self) -> None:
+        """Закрыть соединение с базой кэша"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# Глобальный экземпляр кэша
+embedding_cache = EmbeddingCache(settings.embedding_cache_path, settings.embedding_memory_cache_size)
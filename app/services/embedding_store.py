@@ -0,0 +1,150 @@
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+import structlog
+
+try:
+    import fcntl
+except ImportError:  # Windows - блокировка только между потоками одного процесса
+    fcntl = None
+
+logger = structlog.get_logger()
+
+
+class EmbeddingStore:
+    """Дописываемый файл нормированных эмбеддингов float32 с доступом через mmap
+
+    Каждая запись - ID фотографии (int64) и вектор float32, поэтому метка и
+    вектор пишутся одним куском, а недописанный хвост просто отбрасывается.
+    Отрицательный ID -photo_id отмечает удаление фотографии. При повторе ID
+    действует последняя запись, так что повторно выданный SQLite ID не получит
+    вектор удаленной фотографии. Источником данных остается БД: если файл не
+    покрывает все активные фотографии, он перезаписывается.
+
+    Файл общий для всех воркеров, поэтому кроме блокировки потоков операции
+    берут flock на файле path.lock: запись - эксклюзивный, чтение - разделяемый.
+    """
+
+    def __init__(self, path: str, dim: int):
+        self.path = Path(path)
+        self.lock_path = self.path.with_name(self.path.name + '.lock')
+        self.dim = dim
+        self.record_dtype = np.dtype([('photo_id', '<i8'), ('embedding', '<f4', (dim,))])
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self, exclusive: bool) -> Iterator[None]:
+        """Блокировка между потоками и процессами
+
+        Файл блокировки открывается заново на каждую операцию: дескриптор,
+        унаследованный через fork, разделял бы flock между процессами.
+        """
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+
+            self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _size(self) -> int:
+        """Число полностью записанных записей"""
+        if not self.path.exists():
+            return 0
+        return self.path.stat().st_size // self.record_dtype.itemsize
+
+    def _records(self, photo_ids: np.ndarray, embeddings: np.ndarray) -> bytes:
+        records = np.empty(len(photo_ids), dtype=self.record_dtype)
+        records['photo_id'] = photo_ids
+        records['embedding'] = embeddings
+        return records.tobytes()
+
+    def _append(self, photo_ids: np.ndarray, embeddings: np.ndarray) -> None:
+        """Дописать записи (под эксклюзивной блокировкой)"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        size = self._size()
+        with open(self.path, 'ab') as f:
+            # Обрезаем недописанную запись, оставшуюся после сбоя; под
+            # эксклюзивной блокировкой других писателей нет
+            f.truncate(size * self.record_dtype.itemsize)
+            f.write(self._records(photo_ids, embeddings))
+
+    def size(self) -> int:
+        """Число записей в файле, передается в rewrite() как expected_size"""
+        with self._locked(exclusive=False):
+            return self._size()
+
+    def append(self, photo_ids: Iterable[int], embeddings: np.ndarray) -> None:
+        """Дописать нормированные эмбеддинги фотографий (N x dim)"""
+        photo_ids = np.fromiter(photo_ids, dtype=np.int64)
+        if not len(photo_ids):
+            return
+        try:
+            with self._locked(exclusive=True):
+                self._append(photo_ids, np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim))
+        except OSError as e:
+            logger.warning("Failed to append embeddings", count=len(photo_ids), error=str(e))
+
+    def remove(self, photo_ids: Iterable[int]) -> None:
+        """Отметить фотографии удаленными"""
+        labels = -np.fromiter(photo_ids, dtype=np.int64)
+        if not len(labels):
+            return
+        try:
+            with self._locked(exclusive=True):
+                self._append(labels, np.zeros((len(labels), self.dim), dtype=np.float32))
+        except OSError as e:
+            logger.warning("Failed to mark embeddings removed", error=str(e))
+
+    def _memmap(self, size: int) -> np.memmap:
+        return np.memmap(self.path, dtype=self.record_dtype, mode='r', shape=(size,))
+
+    def lookup(self, photo_ids: np.ndarray) -> Optional[np.ndarray]:
+        """Эмбеддинги для photo_ids (N x dim) или None, если каких-то фотографий нет"""
+        photo_ids = np.asarray(photo_ids, dtype=np.int64)
+        with self._locked(exclusive=False):
+            size = self._size()
+            if not size:
+                return None if len(photo_ids) else np.empty((0, self.dim), dtype=np.float32)
+
+            records = self._memmap(size)
+            # Последняя запись по каждому ID: первое вхождение в перевернутом порядке
+            reversed_labels = np.asarray(records['photo_id'][::-1])
+            unique_ids, first = np.unique(np.abs(reversed_labels), return_index=True)
+            is_live = reversed_labels[first] > 0
+            rows = size - 1 - first
+
+            positions = np.minimum(np.searchsorted(unique_ids, photo_ids), len(unique_ids) - 1)
+            if not ((unique_ids[positions] == photo_ids) & is_live[positions]).all():
+                return None
+
+            return np.ascontiguousarray(records['embedding'][rows[positions]])
+
+    def rewrite(self, photo_ids: np.ndarray, embeddings: np.ndarray, expected_size: Optional[int] = None) -> None:
+        """Перезаписать файл актуальными эмбеддингами
+
+        expected_size - значение size() до чтения эмбеддингов из БД. Если с тех
+        пор другой воркер дописал записи, снимок мог устареть (новые фото или
+        отметки удаления потерялись бы), и перезапись пропускается.
+        """
+        try:
+            with self._locked(exclusive=True):
+                if expected_size is not None and self._size() != expected_size:
+                    logger.info("Embedding store changed concurrently, skipping rewrite")
+                    return
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = self.path.with_name(self.path.name + '.tmp')
+                tmp_path.write_bytes(self._records(photo_ids, embeddings))
+                os.replace(tmp_path, self.path)
+            logger.info("Embedding store rewritten", size=len(photo_ids))
+        except OSError as e:
+            logger.warning("Failed to rewrite embedding store", error=str(e))
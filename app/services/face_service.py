@@ -1,17 +1,45 @@
 import insightface
+import onnxruntime
+from insightface.utils import face_align
 import cv2
 import numpy as np
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Dict, Any
 import structlog
 from pathlib import Path
+import itertools
+import os
 import threading
 from concurrent.futures import ThreadPoolExecutor
 
 from app.config.settings import settings
+from app.services.embedding_cache import embedding_cache
 from app.utils.exceptions import ModelInitializationError, FaceDetectionError
 
 logger = structlog.get_logger()
 
+# Модель InsightFace, входит в ключ кэша эмбеддингов
+FACE_MODEL_NAME = 'buffalo_l'
+
+# Максимум лиц в одном прогоне модели распознавания
+RECOGNITION_BATCH_SIZE = 32
+
+# Настройки провайдеров ONNX Runtime, не заданные здесь используют значения по умолчанию
+PROVIDER_OPTIONS = {
+    'CUDAExecutionProvider': {
+        'cudnn_conv_algo_search': 'EXHAUSTIVE',
+        'arena_extend_strategy': 'kSameAsRequested',
+    },
+    'TensorrtExecutionProvider': {
+        'trt_engine_cache_enable': True,
+    },
+}
+
+# Потоки для параллельного чтения и декодирования изображений пакета
+IMAGE_LOAD_WORKERS = min(4, os.cpu_count() or 1)
+
+# Сколько последних изображений без лица хранить в uploads/debug
+DEBUG_IMAGES_KEEP = 10
+
 
 class FaceService:
     """Сервис для работы с распознаванием лиц"""
@@ -31,7 +59,12 @@ class FaceService:
             return
 
         self.face_app = None
-        self.executor = ThreadPoolExecutor(max_workers=2)
+        self._init_lock = threading.Lock()
+        # cv2.imread отпускает GIL, поэтому изображения пакета декодируются параллельно
+        self._image_pool = ThreadPoolExecutor(
+            max_workers=IMAGE_LOAD_WORKERS, thread_name_prefix="image-load"
+        )
+        self._debug_counter = itertools.count()
         self._initialized = False
 
     def initialize(self) -> None:
@@ -39,18 +72,51 @@ class FaceService:
         if self._initialized:
             return
 
+        # Вызов возможен одновременно из нескольких потоков пула инференса
+        with self._init_lock:
+            if not self._initialized:
+                self._load_model()
+
+    def _get_providers(self) -> Tuple[List[str], List[Dict[str, Any]]]:
+        """Доступные провайдеры из настроек и их параметры, CPU - всегда последним"""
+        available = set(onnxruntime.get_available_providers())
+        providers = [p for p in settings.get_onnx_providers_list() if p in available]
+        if 'CPUExecutionProvider' not in providers:
+            providers.append('CPUExecutionProvider')
+
+        provider_options = []
+        for provider in providers:
+            options = dict(PROVIDER_OPTIONS.get(provider, {}))
+            if provider in ('CUDAExecutionProvider', 'TensorrtExecutionProvider'):
+                options['device_id'] = settings.onnx_device_id
+            provider_options.append(options)
+        return providers, provider_options
+
+    def is_fork_safe(self) -> bool:
+        """Можно ли загрузить модель до fork воркеров
+
+        Сессии ONNX Runtime на CPU работают в дочерних процессах, а контекст
+        CUDA после fork недействителен, поэтому с GPU модель грузит каждый воркер.
+        """
+        providers, _ = self._get_providers()
+        return providers == ['CPUExecutionProvider']
+
+    def _load_model(self) -> None:
+        """Загрузить модель InsightFace"""
         try:
             # Создаем директорию для кэша моделей
             Path(settings.models_cache_path).mkdir(parents=True, exist_ok=True)
 
-            logger.info("Starting InsightFace initialization...")
+            providers, provider_options = self._get_providers()
+            logger.info("Starting InsightFace initialization...", providers=providers)
 
             # Инициализация по рабочему примеру
             self.face_app = insightface.app.FaceAnalysis(
-                name='buffalo_l',
-                providers=['CPUExecutionProvider']
+                name=FACE_MODEL_NAME,
+                providers=providers,
+                provider_options=provider_options
             )
-            self.face_app.prepare(ctx_id=0, det_size=(640, 640))
+            self.face_app.prepare(ctx_id=settings.onnx_device_id, det_size=(640, 640))
 
             self._initialized = True
             logger.info("FaceService initialized successfully")
@@ -59,19 +125,55 @@ class FaceService:
             logger.error("Failed to initialize FaceService", error=str(e))
             raise ModelInitializationError(f"Не удалось инициализировать модель: {str(e)}")
 
-    def get_face_embedding(self, image_path: str) -> Tuple[np.ndarray, float]:
+    def warm_up(self) -> None:
+        """Прогнать модели на пустых изображениях, чтобы первый запрос не ждал прогрева ONNX"""
+        if not self._initialized:
+            self.initialize()
+
+        det_size = self.face_app.det_model.input_size
+        self.face_app.get(np.zeros((det_size[1], det_size[0], 3), dtype=np.uint8))
+
+        rec_model = self.face_app.models['recognition']
+        rec_model.get_feat([np.zeros((rec_model.input_size[1], rec_model.input_size[0], 3), dtype=np.uint8)])
+        logger.info("Face models warmed up")
+
+    @staticmethod
+    def normalize(embedding: np.ndarray) -> np.ndarray:
+        """Нормировать эмбеддинг до единичной длины"""
+        embedding = np.asarray(embedding, dtype=np.float32)
+        return embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+
+    def get_face_embedding(
+            self,
+            image_path: str,
+            file_hash: Optional[str] = None
+    ) -> Tuple[np.ndarray, float]:
         """
         Получить эмбеддинг лица из изображения
 
         Args:
             image_path: Путь к изображению
+            file_hash: BLAKE3 хэш содержимого файла для поиска в кэше
 
         Returns:
-            Tuple[embedding, confidence]: Эмбеддинг и уверенность детекции
+            Tuple[embedding, confidence]: Нормированный эмбеддинг и уверенность детекции
         """
-        if not self._initialized:
-            self.initialize()
-
+        if file_hash is None:
+            return self._extract_face_embedding(image_path)
+
+        cache_key = embedding_cache.make_key(FACE_MODEL_NAME, file_hash)
+        cached = embedding_cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Embedding cache hit", image_path=image_path)
+            # Записи кэша, сохраненные до нормирования, приводятся к единичной длине
+            return self.normalize(cached[0]), cached[1]
+
+        embedding, confidence = self._extract_face_embedding(image_path)
+        embedding_cache.put(cache_key, embedding, confidence)
+        return embedding, confidence
+
+    def _load_image(self, image_path: str) -> np.ndarray:
+        """Загрузить изображение и проверить его размер"""
         if not Path(image_path).exists():
             raise FaceDetectionError(f'Файл не найден: {image_path}')
 
@@ -84,15 +186,44 @@ class FaceService:
         if height < 50 or width < 50:
             raise FaceDetectionError('Изображение слишком маленькое (минимум 50x50 пикселей)')
 
+        return img
+
+    def _try_load_image(self, image_path: str):
+        """Загрузить изображение, вернув ошибку вместо исключения"""
+        try:
+            return self._load_image(image_path)
+        except FaceDetectionError as e:
+            return e
+
+    def _no_face_error(self, img: np.ndarray) -> FaceDetectionError:
+        """Вернуть ошибку, при DEBUG_SAVE_FAILED_DETECTIONS сохранив изображение для отладки"""
+        if settings.debug_save_failed_detections:
+            # Кодирование JPEG идет в фоне, файлы перезаписываются по кругу
+            slot = next(self._debug_counter) % DEBUG_IMAGES_KEEP
+            debug_path = Path(settings.upload_path) / 'debug' / f'no_faces_debug_{slot}.jpg'
+            self._image_pool.submit(self._save_debug_image, debug_path, img)
+        return FaceDetectionError('Лицо не найдено на изображении')
+
+    @staticmethod
+    def _save_debug_image(debug_path: Path, img: np.ndarray) -> None:
+        try:
+            debug_path.parent.mkdir(parents=True, exist_ok=True)
+            cv2.imwrite(str(debug_path), img)
+        except Exception as e:
+            logger.warning("Failed to save debug image", path=str(debug_path), error=str(e))
+
+    def _extract_face_embedding(self, image_path: str) -> Tuple[np.ndarray, float]:
+        """Запустить детекцию и распознавание лица на изображении"""
+        if not self._initialized:
+            self.initialize()
+
+        img = self._load_image(image_path)
+
         faces = self.face_app.get(img)
         logger.debug(f'Найдено лиц: {len(faces)}', image_path=image_path)
 
         if not faces:
-            # Сохраняем изображение для отладки
-            debug_path = Path(settings.upload_path) / 'debug' / 'no_faces_debug.jpg'
-            debug_path.parent.mkdir(parents=True, exist_ok=True)
-            cv2.imwrite(str(debug_path), img)
-            raise FaceDetectionError('Лицо не найдено на изображении')
+            raise self._no_face_error(img)
 
         if len(faces) > 1:
             logger.warning(f'Найдено {len(faces)} лиц, используется первое', image_path=image_path)
@@ -100,78 +231,76 @@ class FaceService:
         face = faces[0]
         confidence = getattr(face, 'det_score', 0.9)
 
-        return face.embedding, float(confidence)
+        return self.normalize(face.embedding), float(confidence)
 
-    def compare_embeddings(
+    def get_face_embeddings_batch(
             self,
-            embedding1: np.ndarray,
-            embedding2: np.ndarray,
-            threshold: Optional[float] = None
-    ) -> Tuple[bool, float]:
-        """Сравнить два эмбеддинга"""
-        if threshold is None:
-            threshold = settings.face_recognition_threshold
-
-        # Косинусное сходство по рабочему примеру
-        similarity = np.dot(embedding1, embedding2) / (
-                np.linalg.norm(embedding1) * np.linalg.norm(embedding2)
-        )
+            image_paths: List[str],
+            file_hashes: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Получить эмбеддинги лиц для нескольких изображений
 
-        is_same = float(similarity) > threshold
-        return is_same, float(similarity)
+        Изображения декодируются параллельно, детекция выполняется по каждому
+        изображению, а распознавание - одним прогоном модели по всем найденным лицам.
 
-    def find_best_match(
-            self,
-            target_embedding: np.ndarray,
-            candidate_embeddings: List[Tuple[int, np.ndarray]],
-            threshold: Optional[float] = None
-    ) -> Optional[Tuple[int, float]]:
-        """Найти наиболее похожий эмбеддинг"""
-        if not candidate_embeddings:
-            return None
-
-        if threshold is None:
-            threshold = settings.face_recognition_threshold
-
-        best_match = None
-        best_similarity = 0.0
-
-        logger.info("Comparing embeddings",
-                    target_size=len(target_embedding),
-                    candidates_count=len(candidate_embeddings),
-                    threshold=threshold)
-
-        for candidate_id, candidate_embedding in candidate_embeddings:
+        Args:
+            image_paths: Пути к изображениям
+            file_hashes: BLAKE3 хэши файлов для поиска в кэше
+
+        Returns:
+            Список словарей embedding, confidence и error в порядке image_paths
+        """
+        if not self._initialized:
+            self.initialize()
+
+        rec_model = self.face_app.models['recognition']
+        results: List[Dict[str, Any]] = [None] * len(image_paths)
+        cache_keys: List[Optional[str]] = [None] * len(image_paths)
+        to_detect = []
+
+        for i in range(len(image_paths)):
+            if file_hashes is not None:
+                cache_keys[i] = embedding_cache.make_key(FACE_MODEL_NAME, file_hashes[i])
+                cached = embedding_cache.get(cache_keys[i])
+                if cached is not None:
+                    results[i] = {'embedding': self.normalize(cached[0]), 'confidence': cached[1], 'error': None}
+                    continue
+            to_detect.append(i)
+
+        # Декодирование параллельно, детекция - по одному изображению:
+        # у детектора buffalo_l размер пакета в графе ONNX зафиксирован равным 1
+        images = self._image_pool.map(self._try_load_image, [image_paths[i] for i in to_detect])
+        crops, pending = [], []
+
+        for i, img in zip(to_detect, images):
             try:
-                is_match, similarity = self.compare_embeddings(
-                    target_embedding,
-                    candidate_embedding,
-                    threshold
-                )
-
-                logger.debug("Comparison result",
-                             candidate_id=candidate_id,
-                             similarity=similarity,
-                             is_match=is_match)
-
-                if is_match and similarity > best_similarity:
-                    best_similarity = similarity
-                    best_match = (candidate_id, similarity)
-
-            except Exception as e:
-                logger.error("Error comparing embeddings",
-                             candidate_id=candidate_id,
-                             error=str(e))
+                if isinstance(img, FaceDetectionError):
+                    raise img
+                bboxes, kpss = self.face_app.det_model.detect(img, max_num=0, metric='default')
+                if bboxes.shape[0] == 0:
+                    raise self._no_face_error(img)
+            except FaceDetectionError as e:
+                results[i] = {'embedding': None, 'confidence': 0.0, 'error': str(e)}
                 continue
 
-        if best_match:
-            logger.info("Best match found",
-                        photo_id=best_match[0],
-                        similarity=best_match[1])
-        else:
-            logger.info("No match found above threshold", threshold=threshold)
+            if bboxes.shape[0] > 1:
+                logger.warning(f'Найдено {bboxes.shape[0]} лиц, используется первое', image_path=image_paths[i])
+
+            crops.append(face_align.norm_crop(img, landmark=kpss[0], image_size=rec_model.input_size[0]))
+            pending.append((i, float(bboxes[0, 4]), cache_keys[i]))
+
+        # Распознавание всех найденных лиц пачками
+        for start in range(0, len(crops), RECOGNITION_BATCH_SIZE):
+            batch = slice(start, start + RECOGNITION_BATCH_SIZE)
+            features = rec_model.get_feat(crops[batch]).astype(np.float32)
+            features /= np.maximum(np.linalg.norm(features, axis=1, keepdims=True), 1e-12)
+            for (i, confidence, cache_key), embedding in zip(pending[batch], features):
+                results[i] = {'embedding': embedding, 'confidence': confidence, 'error': None}
+                if cache_key is not None:
+                    embedding_cache.put(cache_key, embedding, confidence)
 
-        return best_match
+        return results
 
 
 # Глобальный экземпляр сервиса
@@ -1,17 +1,82 @@
 import aiofiles
+import asyncio
+import blake3
+from fastapi import UploadFile
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 import structlog
 from datetime import datetime
-import hashlib
+import mmap
+import os
+import shutil
+import struct
 import uuid
-from PIL import Image
 
 from app.config.settings import settings
 from app.utils.exceptions import FileValidationError, FileStorageError
+from app.utils.validators import get_file_extension
 
 logger = structlog.get_logger()
 
+# Размер части при потоковом копировании загрузки на диск
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_COLOR_MODES = {0: 'L', 2: 'RGB', 3: 'P', 4: 'LA', 6: 'RGBA'}
+JPEG_COMPONENT_MODES = {1: 'L', 3: 'RGB', 4: 'CMYK'}
+# Маркеры SOF с размерами кадра (кроме DHT, JPG и DAC)
+JPEG_SOF_MARKERS = frozenset({0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF})
+# Маркеры без поля длины
+JPEG_STANDALONE_MARKERS = frozenset({0x01, *range(0xD0, 0xD8)})
+
+
+def read_image_header(file_path: str) -> Optional[Tuple[str, str, int, int]]:
+    """Прочитать формат, режим и размеры JPEG/PNG из заголовка, не декодируя пиксели
+
+    Возвращает (format, mode, width, height) или None, если заголовок не распознан.
+    """
+    with open(file_path, 'rb') as f:
+        head = f.read(26)
+        if head.startswith(PNG_SIGNATURE):
+            if head[12:16] != b'IHDR':
+                return None
+            width, height = struct.unpack('>II', head[16:24])
+            return 'PNG', PNG_COLOR_MODES.get(head[25], 'RGB'), width, height
+
+        if not head.startswith(b'\xff\xd8'):
+            return None
+
+        # Обходим сегменты JPEG до маркера SOF, пропуская содержимое через seek
+        f.seek(2)
+        while True:
+            byte = f.read(1)
+            if not byte:
+                return None
+            if byte != b'\xff':
+                continue
+            marker = f.read(1)
+            while marker == b'\xff':
+                marker = f.read(1)
+            if not marker:
+                return None
+            marker = marker[0]
+            if marker in JPEG_STANDALONE_MARKERS:
+                continue
+            if marker in (0xD9, 0xDA):
+                return None
+
+            segment = f.read(2)
+            if len(segment) < 2:
+                return None
+            length = struct.unpack('>H', segment)[0]
+            if marker in JPEG_SOF_MARKERS:
+                frame = f.read(6)
+                if len(frame) < 6:
+                    return None
+                height, width = struct.unpack('>HH', frame[1:5])
+                return 'JPEG', JPEG_COMPONENT_MODES.get(frame[5], 'RGB'), width, height
+            f.seek(length - 2, os.SEEK_CUR)
+
 
 class FileService:
     """Сервис для работы с файлами"""
@@ -20,6 +85,7 @@ class FileService:
         self.upload_path = Path(settings.upload_path)
         self.max_file_size = settings.max_upload_size
         self.allowed_extensions = settings.get_allowed_extensions_list()
+        self.allowed_extensions_set = settings.get_allowed_extensions_set()
 
         # Создаем необходимые директории
         self._create_directories()
@@ -41,41 +107,48 @@ class FileService:
         if not filename:
             return False
 
-        extension = Path(filename).suffix.lower().lstrip('.')
-        return extension in self.allowed_extensions
+        return get_file_extension(filename) in self.allowed_extensions_set
 
     def validate_file_size(self, file_size: int) -> bool:
         """Проверить размер файла"""
         return 0 < file_size <= self.max_file_size
 
-    async def validate_image_content(self, file_path: str) -> Dict[str, Any]:
-        """Валидация содержимого изображения"""
+    def validate_image_content(self, file_path: str) -> Dict[str, Any]:
+        """Валидация содержимого изображения по заголовку файла"""
         try:
-            with Image.open(file_path) as img:
-                info = {
-                    'is_valid': True,
-                    'format': img.format,
-                    'mode': img.mode,
-                    'size': img.size,
-                    'width': img.width,
-                    'height': img.height,
-                    'errors': []
-                }
-
-                # Проверки
-                if img.width < 50 or img.height < 50:
-                    info['errors'].append('Изображение слишком маленькое (минимум 50x50)')
-                    info['is_valid'] = False
-
-                if img.width > 5000 or img.height > 5000:
-                    info['errors'].append('Изображение слишком большое (максимум 5000x5000)')
-                    info['is_valid'] = False
-
-                if img.format not in ['JPEG', 'PNG']:
-                    info['errors'].append('Неподдерживаемый формат изображения')
-                    info['is_valid'] = False
-
-                return info
+            header = read_image_header(file_path)
+            if header is None:
+                # Заголовок не разобран - открываем файл через Pillow
+                from PIL import Image
+
+                with Image.open(file_path) as img:
+                    header = img.format, img.mode, img.width, img.height
+
+            image_format, mode, width, height = header
+            info = {
+                'is_valid': True,
+                'format': image_format,
+                'mode': mode,
+                'size': (width, height),
+                'width': width,
+                'height': height,
+                'errors': []
+            }
+
+            # Проверки
+            if width < 50 or height < 50:
+                info['errors'].append('Изображение слишком маленькое (минимум 50x50)')
+                info['is_valid'] = False
+
+            if width > 5000 or height > 5000:
+                info['errors'].append('Изображение слишком большое (максимум 5000x5000)')
+                info['is_valid'] = False
+
+            if image_format not in ['JPEG', 'PNG']:
+                info['errors'].append('Неподдерживаемый формат изображения')
+                info['is_valid'] = False
+
+            return info
 
         except Exception as e:
             return {
@@ -95,21 +168,29 @@ class FileService:
             return f"temp_{timestamp}_{unique_id}{extension}"
 
     def get_file_hash(self, file_path: str) -> str:
-        """Получить хэш файла"""
-        hasher = hashlib.md5()
+        """Получить хэш файла, передавая BLAKE3 отображенный в память файл целиком"""
         with open(file_path, 'rb') as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hasher.update(chunk)
-        return hasher.hexdigest()
+            # Пустой файл нельзя отобразить в память
+            if os.fstat(f.fileno()).st_size == 0:
+                return blake3.blake3().hexdigest()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return blake3.blake3(mm, max_threads=blake3.blake3.AUTO).hexdigest()
+
+    def _file_too_large_error(self) -> FileValidationError:
+        """Ошибка превышения максимального размера файла"""
+        return FileValidationError(
+            f"Файл слишком большой. Максимальный размер: "
+            f"{self.max_file_size / (1024 * 1024):.1f} MB"
+        )
 
     async def save_uploaded_file(
             self,
-            file_data: bytes,
-            original_filename: str,
+            upload: UploadFile,
             person_id: Optional[int] = None,
             temp: bool = False
     ) -> Dict[str, Any]:
-        """Сохранить загруженный файл"""
+        """Сохранить загруженный файл, копируя его на диск по частям"""
+        original_filename = upload.filename
         try:
             # Валидация расширения
             if not self.validate_file_extension(original_filename):
@@ -118,12 +199,9 @@ class FileService:
                     f"Разрешены: {', '.join(self.allowed_extensions)}"
                 )
 
-            # Валидация размера
-            if not self.validate_file_size(len(file_data)):
-                raise FileValidationError(
-                    f"Файл слишком большой. Максимальный размер: "
-                    f"{self.max_file_size / (1024 * 1024):.1f} MB"
-                )
+            # Валидация размера (если он известен заранее)
+            if upload.size is not None and not self.validate_file_size(upload.size):
+                raise self._file_too_large_error()
 
             # Генерируем уникальное имя файла
             unique_filename = self.generate_unique_filename(original_filename, person_id)
@@ -139,28 +217,37 @@ class FileService:
 
             file_path = save_dir / unique_filename
 
-            # Сохраняем файл
+            # Копируем файл по частям, считая размер и хэш на лету
+            hasher = blake3.blake3()
+            file_size = 0
+            await upload.seek(0)
             async with aiofiles.open(file_path, 'wb') as f:
-                await f.write(file_data)
+                while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                    file_size += len(chunk)
+                    if file_size > self.max_file_size:
+                        break
+                    hasher.update(chunk)
+                    await f.write(chunk)
+
+            if not self.validate_file_size(file_size):
+                self.delete_file(str(file_path))
+                raise self._file_too_large_error()
 
             # Валидация содержимого изображения
-            image_info = await self.validate_image_content(str(file_path))
+            image_info = self.validate_image_content(str(file_path))
 
             if not image_info['is_valid']:
                 # Удаляем некорректный файл
-                await self.delete_file(str(file_path))
+                self.delete_file(str(file_path))
                 raise FileValidationError('; '.join(image_info['errors']))
 
-            # Получаем хэш файла
-            file_hash = self.get_file_hash(str(file_path))
-
             result = {
                 'filename': unique_filename,
                 'original_filename': original_filename,
                 'file_path': str(file_path),
                 'relative_path': str(file_path.relative_to(self.upload_path)),
-                'file_size': len(file_data),
-                'file_hash': file_hash,
+                'file_size': file_size,
+                'file_hash': hasher.hexdigest(),
                 'person_id': person_id,
                 'is_temp': temp,
                 'image_info': image_info
@@ -168,7 +255,7 @@ class FileService:
 
             logger.info("File saved successfully",
                         filename=unique_filename,
-                        size=len(file_data),
+                        size=file_size,
                         person_id=person_id)
 
             return result
@@ -179,7 +266,41 @@ class FileService:
             logger.error("Failed to save file", error=str(e), filename=original_filename)
             raise FileStorageError(f"Не удалось сохранить файл: {str(e)}")
 
-    async def delete_file(self, file_path: str) -> bool:
+    def promote_temp_to_person(self, file_info: Dict[str, Any], person_id: int) -> Dict[str, Any]:
+        """Переместить сохраненный временный файл в папку человека без повторной записи"""
+        try:
+            unique_filename = self.generate_unique_filename(file_info['original_filename'], person_id)
+            save_dir = self.upload_path / 'persons' / str(person_id)
+            save_dir.mkdir(parents=True, exist_ok=True)
+            file_path = save_dir / unique_filename
+
+            # Переименование в пределах раздела диска, иначе - перемещение с копированием
+            try:
+                os.replace(file_info['file_path'], file_path)
+            except OSError:
+                shutil.move(file_info['file_path'], file_path)
+
+            result = {
+                **file_info,
+                'filename': unique_filename,
+                'file_path': str(file_path),
+                'relative_path': str(file_path.relative_to(self.upload_path)),
+                'person_id': person_id,
+                'is_temp': False
+            }
+
+            logger.info("File saved successfully",
+                        filename=unique_filename,
+                        size=file_info['file_size'],
+                        person_id=person_id)
+
+            return result
+
+        except Exception as e:
+            logger.error("Failed to promote temp file", error=str(e), file_path=file_info['file_path'])
+            raise FileStorageError(f"Не удалось сохранить файл: {str(e)}")
+
+    def delete_file(self, file_path: str) -> bool:
         """Удалить файл"""
         try:
             path = Path(file_path)
@@ -193,8 +314,25 @@ class FileService:
             logger.error("Failed to delete file", error=str(e), file_path=file_path)
             return False
 
+    def _find_stale_files(self, directory: Path, cutoff_time: float) -> List[str]:
+        """Файлы каталога старше cutoff_time (stat берется из кэша DirEntry)"""
+        with os.scandir(directory) as entries:
+            return [
+                entry.path for entry in entries
+                if entry.is_file() and entry.stat().st_mtime < cutoff_time
+            ]
+
+    @staticmethod
+    def _unlink(file_path: str) -> bool:
+        try:
+            os.unlink(file_path)
+            return True
+        except OSError as e:
+            logger.error("Failed to delete file", error=str(e), file_path=file_path)
+            return False
+
     async def cleanup_temp_files(self, older_than_hours: int = 24) -> int:
-        """Очистить старые временные файлы"""
+        """Очистить старые временные файлы, удаляя их параллельно в пуле потоков"""
         temp_dir = self.upload_path / 'temp'
         if not temp_dir.exists():
             return 0
@@ -203,12 +341,11 @@ class FileService:
         cutoff_time = datetime.now().timestamp() - (older_than_hours * 3600)
 
         try:
-            for file_path in temp_dir.iterdir():
-                if file_path.is_file():
-                    file_stat = file_path.stat()
-                    if file_stat.st_mtime < cutoff_time:
-                        await self.delete_file(str(file_path))
-                        deleted_count += 1
+            stale_files = await asyncio.to_thread(self._find_stale_files, temp_dir, cutoff_time)
+            results = await asyncio.gather(
+                *(asyncio.to_thread(self._unlink, file_path) for file_path in stale_files)
+            )
+            deleted_count = sum(results)
 
             logger.info("Temp files cleanup completed",
                         deleted_count=deleted_count,
@@ -1,21 +1,358 @@
 from typing import List, Optional, Dict, Any, Tuple
-from sqlalchemy.orm import Session
+from cachetools import TTLCache
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import case, func, insert, select, update
+from sqlalchemy.orm import Session, aliased, selectinload
 import structlog
 import numpy as np
 import pickle
+import threading
 
-from app.models.database import Person as PersonDB, Photo as PhotoDB
+from app.models.database import CacheVersion, Person as PersonDB, Photo as PhotoDB
 from app.models.person import Person, PersonCreate, PersonUpdate, PersonWithPhotos, Photo, IdentificationResult
 from app.services.face_service import face_service
+from app.services.embedding_store import EmbeddingStore
+from app.services.vector_index import HNSWVectorIndex
 from app.config.settings import settings
 from app.utils.exceptions import PersonNotFoundError, DatabaseError, FaceDetectionError
 
 logger = structlog.get_logger()
 
+# Размерность эмбеддинга InsightFace buffalo_l
+EMBEDDING_SIZE = 512
+EMBEDDING_BYTES = EMBEDDING_SIZE * np.dtype(np.float32).itemsize
+# Эмбеддинги хранятся в БД в float16 - вдвое меньше байт
+EMBEDDING_STORAGE_DTYPE = np.float16
+EMBEDDING_STORAGE_BYTES = EMBEDDING_SIZE * np.dtype(EMBEDDING_STORAGE_DTYPE).itemsize
+
+# Минимальный отрыв лучшего центроида от второго, при котором поиск
+# ограничивается фотографиями одного человека
+CENTROID_MARGIN = 0.1
+
+# Строка CacheVersion со счетчиком изменений активных эмбеддингов
+EMBEDDINGS_VERSION_KEY = "embeddings"
+
+
+def encode_embedding(embedding: np.ndarray) -> bytes:
+    """Упаковать нормированный эмбеддинг в байты для хранения в БД"""
+    return face_service.normalize(embedding).astype(EMBEDDING_STORAGE_DTYPE).tobytes()
+
+
+def is_valid_embedding(embedding: np.ndarray) -> bool:
+    """Эмбеддинг модели: вектор float32 длины EMBEDDING_SIZE"""
+    return (
+        isinstance(embedding, np.ndarray)
+        and embedding.shape == (EMBEDDING_SIZE,)
+        and embedding.dtype == np.float32
+    )
+
+
+def decode_embedding(raw: bytes) -> np.ndarray:
+    """Восстановить эмбеддинг float32 из байтов, сохраненных в БД"""
+    if len(raw) == EMBEDDING_STORAGE_BYTES:
+        return np.frombuffer(raw, dtype=EMBEDDING_STORAGE_DTYPE).astype(np.float32)
+    # Записи в сыром float32
+    if len(raw) == EMBEDDING_BYTES:
+        return np.frombuffer(raw, dtype=np.float32)
+    # Записи, сохраненные до перехода на сырые float32, хранятся в pickle
+    return pickle.loads(raw)
+
+
+class EmbeddingMatrixCache:
+    """Матрица эмбеддингов активных фотографий, синхронизируемая с БД
+
+    Загружается из БД при первой идентификации, затем обновляется при
+    добавлении и удалении фотографий. Строки матрицы хранятся нормированными,
+    поэтому косинусное сходство - одно умножение матрицы на вектор. Удаленные строки помечаются маской,
+    новые - дописываются в матрицу перед ближайшим поиском. Начиная с
+    index_min_size строк поиск идет по HNSW индексу, если установлен faiss.
+
+    Для каждого человека хранится центроид - нормированное среднее его
+    эмбеддингов. Если лучший центроид заметно ближе второго, сравнение
+    идет только с фотографиями этого человека.
+
+    Кэш свой в каждом воркере, поэтому version - значение общего счетчика
+    изменений в БД, которому соответствует матрица. Изменение применяется на
+    месте, только если оно следующее по счету; иначе кэш перезагружается.
+    """
+
+    def __init__(self, index: Optional[HNSWVectorIndex] = None, index_min_size: int = 0):
+        self.loaded = False
+        self.version = 0
+        self._lock = threading.Lock()
+        self._index = index if index is not None and index.available else None
+        self._index_min_size = index_min_size
+        self._reset()
+
+    def _reset(self) -> None:
+        self._matrix = np.empty((0, EMBEDDING_SIZE), dtype=np.float32)
+        self._photo_ids = np.empty(0, dtype=np.int64)
+        self._person_ids = np.empty(0, dtype=np.int64)
+        self._valid = np.empty(0, dtype=bool)
+        self._rows: Dict[int, int] = {}
+        self._pending: List[Tuple[int, int, np.ndarray]] = []
+        # Суммы нормированных эмбеддингов и число фото по людям
+        self._person_sums: Dict[int, np.ndarray] = {}
+        self._person_counts: Dict[int, int] = {}
+        self._centroids = np.empty((0, EMBEDDING_SIZE), dtype=np.float32)
+        self._centroid_person_ids = np.empty(0, dtype=np.int64)
+        self._centroids_dirty = False
+
+    @staticmethod
+    def _unit(embedding: np.ndarray) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32)
+        return embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+
+    def _add_to_centroid(self, person_id: int, embedding: np.ndarray) -> None:
+        unit = self._unit(embedding)
+        if person_id in self._person_sums:
+            self._person_sums[person_id] += unit
+            self._person_counts[person_id] += 1
+        else:
+            self._person_sums[person_id] = unit.copy()
+            self._person_counts[person_id] = 1
+        self._centroids_dirty = True
+
+    def _remove_from_centroid(self, person_id: int, embedding: np.ndarray) -> None:
+        if person_id not in self._person_sums:
+            return
+        self._person_counts[person_id] -= 1
+        if self._person_counts[person_id] <= 0:
+            del self._person_sums[person_id]
+            del self._person_counts[person_id]
+        else:
+            self._person_sums[person_id] -= self._unit(embedding)
+        self._centroids_dirty = True
+
+    def _refresh_centroids(self) -> None:
+        """Пересобрать матрицу центроидов (K x d) из сумм по людям"""
+        if not self._centroids_dirty:
+            return
+        if self._person_sums:
+            self._centroid_person_ids = np.fromiter(self._person_sums, dtype=np.int64)
+            sums = np.stack(list(self._person_sums.values()))
+            norms = np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+            self._centroids = np.ascontiguousarray(sums / norms, dtype=np.float32)
+        else:
+            self._centroids = np.empty((0, EMBEDDING_SIZE), dtype=np.float32)
+            self._centroid_person_ids = np.empty(0, dtype=np.int64)
+        self._centroids_dirty = False
+
+    def load(self, photo_ids: np.ndarray, person_ids: np.ndarray, matrix: np.ndarray, version: int = 0) -> None:
+        """Заполнить кэш результатом get_active_embedding_matrix
+
+        matrix - эмбеддинги (N x d), уже нормированные по строкам; version -
+        значение счетчика изменений, прочитанное до запроса матрицы.
+        """
+        with self._lock:
+            self.version = version
+            self._reset()
+            if self._index is not None:
+                self._index.reset()
+
+            self._matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+            self._photo_ids = np.asarray(photo_ids, dtype=np.int64)
+            self._person_ids = np.asarray(person_ids, dtype=np.int64)
+            self._valid = np.ones(len(self._photo_ids), dtype=bool)
+            self._rows = {int(photo_id): i for i, photo_id in enumerate(self._photo_ids)}
+
+            # Суммы по людям одним проходом вместо добавления по строке
+            unique_person_ids, inverse, counts = np.unique(
+                self._person_ids, return_inverse=True, return_counts=True
+            )
+            sums = np.zeros((len(unique_person_ids), EMBEDDING_SIZE), dtype=np.float32)
+            np.add.at(sums, inverse, self._matrix)
+            self._person_sums = {int(pid): sums[i] for i, pid in enumerate(unique_person_ids)}
+            self._person_counts = {int(pid): int(counts[i]) for i, pid in enumerate(unique_person_ids)}
+            self._centroids_dirty = True
+            self.loaded = True
+
+    def _advance(self, version: Optional[int]) -> bool:
+        """Перейти к версии version (под блокировкой); False - изменение не применять
+
+        Если между версиями есть чужие изменения или кэш уже перезагружен с
+        этим изменением, применять его на месте нельзя: кэш догонит БД при
+        следующей синхронизации.
+        """
+        if version is None:
+            return True
+        if self.version != version - 1:
+            return False
+        self.version = version
+        return True
+
+    def add(self, photo_id: int, person_id: int, embedding: np.ndarray, version: Optional[int] = None) -> None:
+        """Добавить эмбеддинг новой фотографии"""
+        with self._lock:
+            if self.loaded and self._advance(version):
+                self._pending.append((photo_id, person_id, embedding))
+                self._add_to_centroid(person_id, embedding)
+                if self._index is not None and self._index.built:
+                    self._index.add(photo_id, embedding)
+
+    def remove(self, photo_id: int, version: Optional[int] = None) -> None:
+        """Исключить фотографию из поиска"""
+        with self._lock:
+            if not self._advance(version):
+                return
+            for pending in self._pending:
+                if pending[0] == photo_id:
+                    self._remove_from_centroid(pending[1], pending[2])
+            self._pending = [row for row in self._pending if row[0] != photo_id]
+            row = self._rows.pop(photo_id, None)
+            if row is not None:
+                self._valid[row] = False
+                self._remove_from_centroid(int(self._person_ids[row]), self._matrix[row])
+            if self._index is not None and self._index.built:
+                self._index.remove(photo_id)
+
+    def remove_person(self, person_id: int, version: Optional[int] = None) -> None:
+        """Исключить из поиска все фотографии человека"""
+        with self._lock:
+            if not self._advance(version):
+                return
+            if person_id in self._person_sums:
+                del self._person_sums[person_id]
+                del self._person_counts[person_id]
+                self._centroids_dirty = True
+            removed = [row[0] for row in self._pending if row[1] == person_id]
+            self._pending = [row for row in self._pending if row[1] != person_id]
+            for row in np.flatnonzero(self._valid & (self._person_ids == person_id)):
+                removed.append(int(self._photo_ids[row]))
+                self._rows.pop(int(self._photo_ids[row]), None)
+                self._valid[row] = False
+            if self._index is not None and self._index.built:
+                for photo_id in removed:
+                    self._index.remove(photo_id)
+
+    def _apply_pending(self) -> None:
+        """Дописать новые строки и убрать удаленные (под блокировкой)"""
+        if not self._pending and self._valid.all():
+            return
+
+        keep = self._valid
+        matrix = [self._matrix[keep]]
+        photo_ids = [self._photo_ids[keep]]
+        person_ids = [self._person_ids[keep]]
+
+        if self._pending:
+            pending = np.stack([
+                np.asarray(embedding, dtype=np.float32) for _, _, embedding in self._pending
+            ])
+            norms = np.maximum(np.linalg.norm(pending, axis=1, keepdims=True), 1e-12)
+            matrix.append(pending / norms)
+            photo_ids.append(np.array([row[0] for row in self._pending], dtype=np.int64))
+            person_ids.append(np.array([row[1] for row in self._pending], dtype=np.int64))
+
+        self._matrix = np.ascontiguousarray(np.concatenate(matrix), dtype=np.float32)
+        self._photo_ids = np.concatenate(photo_ids)
+        self._person_ids = np.concatenate(person_ids)
+        self._valid = np.ones(len(self._photo_ids), dtype=bool)
+        self._rows = {int(photo_id): i for i, photo_id in enumerate(self._photo_ids)}
+        self._pending = []
+
+    def find_best_match(self, target_embedding: np.ndarray) -> Optional[Tuple[int, int, float]]:
+        """Найти ближайший эмбеддинг: (photo_id, person_id, similarity)
+
+        Под блокировкой применяются изменения и берется снимок массивов.
+        Массивы не изменяются на месте, а заменяются, поэтому умножения
+        идут без блокировки и параллельные идентификации не ждут друг друга.
+        """
+        target = self._unit(target_embedding)
+
+        with self._lock:
+            self._apply_pending()
+            if not len(self._photo_ids):
+                return None
+
+            if self._index is not None and len(self._photo_ids) >= self._index_min_size:
+                if not self._index.built:
+                    self._index.load_or_build(self._photo_ids, self._matrix)
+                for photo_id, similarity in self._index.search(target):
+                    row = self._rows.get(photo_id)
+                    if row is not None:
+                        return photo_id, int(self._person_ids[row]), min(similarity, 1.0)
+
+            self._refresh_centroids()
+            matrix, photo_ids, person_ids = self._matrix, self._photo_ids, self._person_ids
+            centroids, centroid_person_ids = self._centroids, self._centroid_person_ids
+
+        rows = self._rows_by_centroid(target, centroids, centroid_person_ids, person_ids)
+        if rows is None:
+            # Косинусное сходство со всеми строками одним умножением матрицы на вектор
+            similarities = matrix @ target
+            best = int(np.argmax(similarities))
+        else:
+            similarities = matrix[rows] @ target
+            best = int(rows[int(np.argmax(similarities))])
+
+        return (
+            int(photo_ids[best]),
+            int(person_ids[best]),
+            min(float(similarities.max()), 1.0)
+        )
+
+    @staticmethod
+    def _rows_by_centroid(
+            target: np.ndarray,
+            centroids: np.ndarray,
+            centroid_person_ids: np.ndarray,
+            person_ids: np.ndarray
+    ) -> Optional[np.ndarray]:
+        """Строки фотографий человека с ближайшим центроидом
+
+        Возвращает None, если центроиды не дают однозначного кандидата.
+        """
+        if len(centroid_person_ids) < 2:
+            return None
+
+        scores = centroids @ target
+        second, best = np.argpartition(scores, -2)[-2:]
+        if scores[best] < scores[second]:
+            best, second = second, best
+        if scores[best] - scores[second] < CENTROID_MARGIN:
+            return None
+
+        rows = np.flatnonzero(person_ids == centroid_person_ids[best])
+        if not len(rows):
+            return None
+        return rows
+
+    def save_index(self) -> None:
+        """Сохранить HNSW индекс на диск"""
+        with self._lock:
+            if self._index is not None:
+                self._index.save()
+
+
+# Кэш эмбеддингов процесса
+_embedding_cache = EmbeddingMatrixCache(
+    index=HNSWVectorIndex(settings.vector_index_path, dim=EMBEDDING_SIZE),
+    index_min_size=settings.vector_index_min_size
+)
+# Копия нормированных эмбеддингов на диске для загрузки без разбора BLOB
+_embedding_store = EmbeddingStore(settings.embedding_store_path, dim=EMBEDDING_SIZE)
+
+
+# Размер и время жизни кэша списка людей для выпадающих списков страниц
+PERSONS_LIST_LIMIT = 1000
+PERSONS_LIST_TTL = 30
+
 
 class PersonService:
     """Сервис для работы с людьми и их фотографиями"""
 
+    def __init__(self):
+        # Ключ кэша включает версию, которая растет при каждом изменении людей.
+        # TTL ограничивает устаревание, когда изменения пришли из другого процесса
+        self._persons_cache = TTLCache(maxsize=2, ttl=PERSONS_LIST_TTL)
+        self._version = 0
+
+    def _invalidate_persons_cache(self) -> None:
+        """Сбросить кэш списка людей после изменения"""
+        self._version += 1
+        self._persons_cache.clear()
+
     def create_person(self, db: Session, person_data: PersonCreate) -> Person:
         """Создать нового человека"""
         try:
@@ -24,6 +361,8 @@ class PersonService:
             db.commit()
             db.refresh(db_person)
 
+            self._invalidate_persons_cache()
+
             logger.info("Person created", person_id=db_person.id, name=person_data.name)
             return Person.from_orm(db_person)
 
@@ -39,17 +378,19 @@ class PersonService:
             return Person.from_orm(db_person)
         return None
 
-    def get_person_with_photos(self, db: Session, person_id: int) -> Optional[PersonWithPhotos]:
-        """Получить человека с его фотографиями"""
-        db_person = db.query(PersonDB).filter(PersonDB.id == person_id).first()
-        if not db_person:
-            return None
+    def _load_person_with_photos(self, db: Session, person_id: int) -> Optional[PersonDB]:
+        """Загрузить человека вместе со всеми фотографиями (два запроса)"""
+        return db.query(PersonDB).options(
+            selectinload(PersonDB.photos)
+        ).filter(PersonDB.id == person_id).first()
 
-        # Получаем активные фотографии
-        active_photos = db.query(PhotoDB).filter(
-            PhotoDB.person_id == person_id,
-            PhotoDB.is_active == True
-        ).order_by(PhotoDB.created_at.desc()).all()
+    def _build_person_with_photos(self, db_person: PersonDB) -> PersonWithPhotos:
+        """Собрать модель человека с активными фотографиями, новые - первыми"""
+        active_photos = sorted(
+            (photo for photo in db_person.photos if photo.is_active),
+            key=lambda photo: photo.created_at,
+            reverse=True
+        )
 
         person_dict = {
             'id': db_person.id,
@@ -61,6 +402,24 @@ class PersonService:
 
         return PersonWithPhotos(**person_dict)
 
+    def get_person_with_photos(self, db: Session, person_id: int) -> Optional[PersonWithPhotos]:
+        """Получить человека с его фотографиями"""
+        db_person = self._load_person_with_photos(db, person_id)
+        if not db_person:
+            return None
+
+        return self._build_person_with_photos(db_person)
+
+    def get_person_with_photos_and_stats(
+            self, db: Session, person_id: int
+    ) -> Tuple[Optional[PersonWithPhotos], Dict[str, Any]]:
+        """Получить человека с фотографиями и его статистику по одной загрузке"""
+        db_person = self._load_person_with_photos(db, person_id)
+        if not db_person:
+            return None, self._build_person_stats([])
+
+        return self._build_person_with_photos(db_person), self._build_person_stats(db_person.photos)
+
     def get_all_persons(self, db: Session, limit: int = 100, offset: int = 0) -> List[Person]:
         """Получить список всех людей"""
         db_persons = db.query(PersonDB).order_by(
@@ -69,6 +428,24 @@ class PersonService:
 
         return [Person.from_orm(person) for person in db_persons]
 
+    def get_all_persons_cached(self, db: Session) -> List[Person]:
+        """Получить список людей для выпадающих списков из кэша"""
+        key = (self._version, 'models')
+        persons = self._persons_cache.get(key)
+        if persons is None:
+            persons = self.get_all_persons(db, limit=PERSONS_LIST_LIMIT)
+            self._persons_cache[key] = persons
+        return persons
+
+    def get_all_persons_json_cached(self, db: Session) -> List[Dict[str, Any]]:
+        """Получить список людей в JSON-совместимом виде из кэша"""
+        key = (self._version, 'json')
+        persons_data = self._persons_cache.get(key)
+        if persons_data is None:
+            persons_data = jsonable_encoder(self.get_all_persons_cached(db))
+            self._persons_cache[key] = persons_data
+        return persons_data
+
     def update_person(self, db: Session, person_id: int, person_data: PersonUpdate) -> Optional[Person]:
         """Обновить данные человека"""
         try:
@@ -81,6 +458,7 @@ class PersonService:
 
             db.commit()
             db.refresh(db_person)
+            self._invalidate_persons_cache()
 
             logger.info("Person updated", person_id=person_id, new_name=person_data.name)
             return Person.from_orm(db_person)
@@ -97,8 +475,13 @@ class PersonService:
             if not db_person:
                 return False
 
+            photo_ids = [photo.id for photo in db_person.photos]
             db.delete(db_person)
+            version = self._bump_embeddings_version(db)
             db.commit()
+            _embedding_cache.remove_person(person_id, version)
+            _embedding_store.remove(photo_ids)
+            self._invalidate_persons_cache()
 
             logger.info("Person deleted", person_id=person_id)
             return True
@@ -114,61 +497,119 @@ class PersonService:
             person_id: int,
             filename: str,
             file_path: str,
-            embedding_vector: List[float],
+            embedding_vector: np.ndarray,
             confidence: float = 0.0
     ) -> Optional[Photo]:
-        """Добавить фотографию к человеку"""
+        """Добавить фотографию к человеку
+
+        embedding_vector - эмбеддинг float32 из face_service
+        """
         # Проверяем валидность эмбеддинга до обращения к базе
-        if not embedding_vector or len(embedding_vector) != 512:
+        if not is_valid_embedding(embedding_vector):
             logger.error(
                 "Invalid embedding vector",
-                embedding_size=len(embedding_vector) if embedding_vector else 0,
-                expected_size=512,
+                shape=getattr(embedding_vector, 'shape', None),
+                dtype=str(getattr(embedding_vector, 'dtype', None)),
             )
             raise FaceDetectionError("Некорректный вектор эмбеддинга")
+        stored_embedding = encode_embedding(embedding_vector)
 
         try:
-            # Конвертируем эмбеддинг в bytes для хранения в SQLite
-            embedding_array = np.array(embedding_vector, dtype=np.float32)
-            embedding_bytes = pickle.dumps(embedding_array)
-
             logger.info(
                 "Saving photo with embedding",
                 person_id=person_id,
                 filename=filename,
-                embedding_size=len(embedding_vector),
+                embedding_size=EMBEDDING_SIZE,
                 confidence=confidence,
             )
 
-            db_photo = PhotoDB(
+            # Вставка через Core без unit of work; из БД возвращаются только сгенерированные поля
+            row = db.execute(
+                insert(PhotoDB).values(
+                    person_id=person_id,
+                    filename=filename,
+                    file_path=file_path,
+                    embedding_vector=stored_embedding,
+                    confidence=confidence,
+                ).returning(
+                    PhotoDB.id, PhotoDB.is_active, PhotoDB.created_at, PhotoDB.updated_at
+                )
+            ).one()
+            version = self._bump_embeddings_version(db)
+            db.commit()
+
+            photo = Photo(
+                id=row.id,
                 person_id=person_id,
                 filename=filename,
                 file_path=file_path,
-                embedding_vector=embedding_bytes,
                 confidence=confidence,
+                is_active=row.is_active,
+                created_at=row.created_at,
+                updated_at=row.updated_at,
             )
+            # В поиск идет то же округленное значение, что сохранено в БД
+            embedding = face_service.normalize(decode_embedding(stored_embedding))
+            _embedding_cache.add(photo.id, person_id, embedding, version)
+            _embedding_store.append([photo.id], embedding)
 
-            db.add(db_photo)
-            db.commit()
-            db.refresh(db_photo)
-
-            # Проверяем, что данные сохранились
-            saved_embedding = pickle.loads(db_photo.embedding_vector)
             logger.info(
                 "Photo saved successfully",
                 person_id=person_id,
-                photo_id=db_photo.id,
+                photo_id=photo.id,
                 filename=filename,
-                saved_embedding_size=len(saved_embedding),
             )
 
-            return Photo.from_orm(db_photo)
+            return photo
 
         except Exception as e:
             db.rollback()
             logger.error("Failed to add photo", error=str(e), person_id=person_id)
             raise DatabaseError(f"Не удалось добавить фотографию: {str(e)}")
 
+    def add_photos_to_person(
+            self,
+            db: Session,
+            person_id: int,
+            photos: List[Dict[str, Any]]
+    ) -> List[Photo]:
+        """Добавить несколько фотографий к человеку одной транзакцией
+
+        Каждый элемент photos содержит filename, file_path, embedding_vector
+        (эмбеддинг float32 из face_service) и confidence.
+        """
+        for photo in photos:
+            if not is_valid_embedding(photo['embedding_vector']):
+                logger.error("Invalid embedding vector", filename=photo['filename'])
+                raise FaceDetectionError("Некорректный вектор эмбеддинга")
+
+        try:
+            rows = [
+                {**photo, 'person_id': person_id, 'embedding_vector': encode_embedding(photo['embedding_vector'])}
+                for photo in photos
+            ]
+            db_photos = db.scalars(insert(PhotoDB).returning(PhotoDB, sort_by_parameter_order=True), rows).all()
+            # Модели собираются до commit, чтобы не перечитывать каждую строку
+            saved_photos = [Photo.from_orm(db_photo) for db_photo in db_photos]
+            last_version = self._bump_embeddings_version(db, len(saved_photos))
+            versions = range(last_version - len(saved_photos) + 1, last_version + 1)
+            db.commit()
+
+            embeddings = [face_service.normalize(decode_embedding(row['embedding_vector'])) for row in rows]
+            # Каждая фотография - отдельное изменение, чтобы версии кэша шли по одной
+            for saved_photo, embedding, version in zip(saved_photos, embeddings, versions):
+                _embedding_cache.add(saved_photo.id, person_id, embedding, version)
+            if embeddings:
+                _embedding_store.append([photo.id for photo in saved_photos], np.stack(embeddings))
+
+            logger.info("Photos saved successfully", person_id=person_id, count=len(saved_photos))
+            return saved_photos
+
+        except Exception as e:
+            db.rollback()
+            logger.error("Failed to add photos", error=str(e), person_id=person_id)
+            raise DatabaseError(f"Не удалось добавить фотографии: {str(e)}")
+
     def delete_photo(self, db: Session, photo_id: int) -> Optional[str]:
         """Удалить фотографию из базы данных и вернуть путь к файлу"""
         try:
@@ -178,7 +619,10 @@ class PersonService:
 
             file_path = db_photo.file_path
             db.delete(db_photo)
+            version = self._bump_embeddings_version(db)
             db.commit()
+            _embedding_cache.remove(photo_id, version)
+            _embedding_store.remove([photo_id])
 
             logger.info("Photo deleted", photo_id=photo_id)
             return file_path
@@ -188,57 +632,12 @@ class PersonService:
             logger.error("Failed to delete photo", error=str(e))
             raise DatabaseError(f"Не удалось удалить фотографию: {str(e)}")
 
-    def get_all_active_embeddings(self, db: Session) -> List[Dict[str, Any]]:
-        """Получить все активные эмбеддинги для поиска"""
-        try:
-            active_photos = db.query(PhotoDB, PersonDB.name).join(
-                PersonDB, PhotoDB.person_id == PersonDB.id
-            ).filter(
-                PhotoDB.is_active == True,
-                PhotoDB.embedding_vector.isnot(None)
-            ).order_by(PhotoDB.created_at.desc()).all()
-
-            embeddings = []
-            for photo, person_name in active_photos:
-                try:
-                    # Десериализуем эмбеддинг из bytes
-                    embedding = pickle.loads(photo.embedding_vector)
-
-                    # Проверяем валидность эмбеддинга
-                    if embedding is None or len(embedding) != 512:
-                        logger.warning("Invalid embedding found",
-                                       photo_id=photo.id,
-                                       embedding_size=len(embedding) if embedding is not None else 0)
-                        continue
-
-                    embeddings.append({
-                        'photo_id': photo.id,
-                        'person_id': photo.person_id,
-                        'person_name': person_name,
-                        'embedding_vector': embedding,
-                        'confidence': photo.confidence
-                    })
-
-                    logger.debug("Loaded embedding",
-                                 photo_id=photo.id,
-                                 person_name=person_name,
-                                 embedding_size=len(embedding))
-
-                except Exception as e:
-                    logger.error("Failed to deserialize embedding",
-                                 photo_id=photo.id,
-                                 error=str(e))
-                    continue
-
-            logger.info("Loaded embeddings for identification",
-                        total_embeddings=len(embeddings))
-            return embeddings
-
-        except Exception as e:
-            logger.error("Failed to get active embeddings", error=str(e))
-            raise DatabaseError(f"Не удалось получить эмбеддинги: {str(e)}")
-
-    def identify_person(self, db: Session, image_path: str) -> Tuple[IdentificationResult, np.ndarray]:
+    def identify_person(
+            self,
+            db: Session,
+            image_path: str,
+            file_hash: Optional[str] = None
+    ) -> Tuple[IdentificationResult, np.ndarray]:
         """Идентифицировать человека по фотографии и вернуть эмбеддинг"""
         from app.utils.exceptions import FaceDetectionError
         try:
@@ -246,7 +645,9 @@ class PersonService:
 
             # Получаем эмбеддинг из изображения
             try:
-                target_embedding, detection_confidence = face_service.get_face_embedding(image_path)
+                target_embedding, detection_confidence = face_service.get_face_embedding(
+                    image_path, file_hash
+                )
             except FaceDetectionError as e:
                 logger.error("Face detection failed", error=str(e), image_path=image_path)
                 raise
@@ -258,10 +659,13 @@ class PersonService:
                         confidence=detection_confidence,
                         embedding_size=len(target_embedding))
 
-            # Получаем все активные эмбеддинги
-            all_embeddings = self.get_all_active_embeddings(db)
+            # Загружаем эмбеддинги из БД при первой идентификации и после
+            # изменений в других воркерах
+            self.preload_embeddings(db)
 
-            if not all_embeddings:
+            best_match = _embedding_cache.find_best_match(target_embedding)
+
+            if not best_match:
                 logger.warning("No embeddings found in database")
                 return IdentificationResult(
                     confidence=detection_confidence,
@@ -269,19 +673,11 @@ class PersonService:
                     is_match=False
                 ), target_embedding
 
-            logger.info("Found embeddings in database", count=len(all_embeddings))
+            best_photo_id, best_person_id, similarity = best_match
 
-            # Подготавливаем кандидатов для сравнения
-            candidates = [
-                (row['photo_id'], row['embedding_vector'])
-                for row in all_embeddings
-            ]
-
-            # Находим лучшее совпадение
-            best_match = face_service.find_best_match(target_embedding, candidates)
-
-            if not best_match:
-                logger.info("No match found above threshold")
+            if similarity <= settings.face_recognition_threshold:
+                logger.info("No match found above threshold",
+                            threshold=settings.face_recognition_threshold)
                 return IdentificationResult(
                     confidence=detection_confidence,
                     similarity=0.0,
@@ -289,22 +685,18 @@ class PersonService:
                 ), target_embedding
 
             # Получаем информацию о найденном человеке
-            best_photo_id, similarity = best_match
-            matched_row = next(
-                (row for row in all_embeddings if row['photo_id'] == best_photo_id),
-                None
-            )
+            matched_person = db.query(PersonDB.name).filter(PersonDB.id == best_person_id).first()
 
-            if matched_row:
+            if matched_person:
                 logger.info("Person identified",
-                            person_id=matched_row['person_id'],
-                            person_name=matched_row['person_name'],
+                            person_id=best_person_id,
+                            person_name=matched_person.name,
                             similarity=similarity,
                             threshold=settings.face_recognition_threshold)
 
                 return IdentificationResult(
-                    person_id=matched_row['person_id'],
-                    person_name=matched_row['person_name'],
+                    person_id=best_person_id,
+                    person_name=matched_person.name,
                     confidence=detection_confidence,
                     similarity=similarity,
                     is_match=True,
@@ -327,42 +719,180 @@ class PersonService:
                 is_match=False
             ), np.array([])
 
+    def _build_person_stats(self, photos: List[PhotoDB]) -> Dict[str, Any]:
+        """Посчитать статистику по уже загруженным фотографиям человека"""
+        active_photos = [p for p in photos if p.is_active]
+        total_photos = len(photos)
+        active_count = len(active_photos)
+
+        avg_confidence = 0.0
+        last_photo_date = None
+        preview_photo = None
+
+        if active_photos:
+            avg_confidence = sum(p.confidence for p in active_photos) / active_count
+            last_photo_date = max(p.created_at for p in active_photos)
+            first_photo = min(active_photos, key=lambda p: p.created_at)
+            preview_photo = first_photo.file_path
+
+        return {
+            'total_photos': total_photos,
+            'active_photos': active_count,
+            'avg_confidence': avg_confidence,
+            'last_photo_date': last_photo_date,
+            'preview_photo': preview_photo
+        }
+
     def get_person_stats(self, db: Session, person_id: int) -> Dict[str, Any]:
-        """Получить статистику по человеку"""
-        try:
-            photos = db.query(PhotoDB).filter(PhotoDB.person_id == person_id).all()
-
-            active_photos = [p for p in photos if p.is_active]
-            total_photos = len(photos)
-            active_count = len(active_photos)
-
-            avg_confidence = 0.0
-            last_photo_date = None
-            preview_photo = None
-
-            if active_photos:
-                avg_confidence = sum(p.confidence for p in active_photos) / active_count
-                last_photo_date = max(p.created_at for p in active_photos)
-                first_photo = min(active_photos, key=lambda p: p.created_at)
-                preview_photo = first_photo.file_path
-
-            return {
-                'total_photos': total_photos,
-                'active_photos': active_count,
-                'avg_confidence': avg_confidence,
-                'last_photo_date': last_photo_date,
-                'preview_photo': preview_photo
-            }
+        """Получить статистику по человеку одним агрегирующим запросом"""
+        return self.get_stats_for_ids(db, [person_id])[person_id]
 
-        except Exception as e:
-            logger.error("Failed to get person stats", error=str(e))
-            return {
+    def get_stats_for_ids(self, db: Session, person_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Получить статистику сразу для нескольких людей одним запросом"""
+        stats = {
+            person_id: {
                 'total_photos': 0,
                 'active_photos': 0,
                 'avg_confidence': 0.0,
                 'last_photo_date': None,
                 'preview_photo': None
             }
+            for person_id in person_ids
+        }
+        if not person_ids:
+            return stats
+
+        try:
+            # Превью - самая ранняя активная фотография человека
+            preview = aliased(PhotoDB)
+            preview_photo = (
+                select(preview.file_path)
+                .where(preview.person_id == PhotoDB.person_id, preview.is_active == True)
+                .order_by(preview.created_at, preview.id)
+                .limit(1)
+                .correlate(PhotoDB)
+                .scalar_subquery()
+            )
+
+            rows = db.execute(
+                select(
+                    PhotoDB.person_id,
+                    func.count(PhotoDB.id),
+                    func.count(case((PhotoDB.is_active == True, 1))),
+                    func.avg(case((PhotoDB.is_active == True, PhotoDB.confidence))),
+                    func.max(case((PhotoDB.is_active == True, PhotoDB.created_at))),
+                    preview_photo
+                )
+                .where(PhotoDB.person_id.in_(person_ids))
+                .group_by(PhotoDB.person_id)
+            ).all()
+
+            for person_id, total, active, avg_confidence, last_photo_date, preview_path in rows:
+                stats[person_id] = {
+                    'total_photos': total,
+                    'active_photos': active,
+                    'avg_confidence': avg_confidence or 0.0,
+                    'last_photo_date': last_photo_date,
+                    'preview_photo': preview_path
+                }
+
+        except Exception as e:
+            logger.error("Failed to get persons stats", error=str(e))
+
+        return stats
+
+    def get_active_embedding_matrix(self, db: Session) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Получить активные эмбеддинги матрицей: (photo_ids, person_ids, matrix)
+
+        Строки matrix (N x 512, float32) нормированы, поэтому косинусное
+        сходство с нормированным вектором - одно умножение matrix @ target.
+        Векторы берутся из файла хранилища через mmap, а из БД - только если
+        хранилище устарело, после чего оно перезаписывается.
+        """
+        # Размер хранилища до чтения БД: если другой воркер допишет записи
+        # после запроса, rewrite() это увидит и не затрет их
+        store_size = _embedding_store.size()
+        active = (PhotoDB.is_active == True, PhotoDB.embedding_vector.isnot(None))
+        id_rows = db.execute(
+            select(PhotoDB.id, PhotoDB.person_id).where(*active).order_by(PhotoDB.created_at.desc())
+        ).all()
+        photo_ids = np.array([row[0] for row in id_rows], dtype=np.int64)
+        person_ids = np.array([row[1] for row in id_rows], dtype=np.int64)
+
+        matrix = _embedding_store.lookup(photo_ids)
+        if matrix is not None:
+            logger.info("Loaded active embeddings from store", count=len(photo_ids))
+            return photo_ids, person_ids, matrix
+
+        rows = db.execute(
+            select(PhotoDB.id, PhotoDB.person_id, PhotoDB.embedding_vector).where(*active)
+            .order_by(PhotoDB.created_at.desc())
+        ).all()
+
+        photo_ids, person_ids, embeddings = [], [], []
+        for photo_id, person_id, raw in rows:
+            try:
+                embedding = decode_embedding(raw)
+            except Exception as e:
+                logger.error("Failed to deserialize embedding", photo_id=photo_id, error=str(e))
+                continue
+
+            if embedding is None or len(embedding) != EMBEDDING_SIZE:
+                logger.warning("Invalid embedding found", photo_id=photo_id)
+                continue
+
+            photo_ids.append(photo_id)
+            person_ids.append(person_id)
+            embeddings.append(embedding)
+
+        photo_ids = np.array(photo_ids, dtype=np.int64)
+        person_ids = np.array(person_ids, dtype=np.int64)
+        if embeddings:
+            matrix = np.stack(embeddings).astype(np.float32, copy=False)
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        else:
+            matrix = np.empty((0, EMBEDDING_SIZE), dtype=np.float32)
+
+        # Битые записи пропущены, поэтому хранилище не покроет их и при следующей загрузке
+        _embedding_store.rewrite(photo_ids, matrix, expected_size=store_size)
+        logger.info("Loaded active embeddings", count=len(photo_ids))
+        return photo_ids, person_ids, matrix
+
+    def _get_embeddings_version(self, db: Session) -> int:
+        """Текущее значение общего счетчика изменений эмбеддингов"""
+        version = db.scalar(select(CacheVersion.version).where(CacheVersion.name == EMBEDDINGS_VERSION_KEY))
+        return version or 0
+
+    def _bump_embeddings_version(self, db: Session, count: int = 1) -> int:
+        """Увеличить счетчик изменений эмбеддингов на count в текущей транзакции
+
+        UPDATE блокирует строку до commit, поэтому прочитанное затем значение -
+        номер именно этого (последнего из count) изменения.
+        """
+        result = db.execute(
+            update(CacheVersion)
+            .where(CacheVersion.name == EMBEDDINGS_VERSION_KEY)
+            .values(version=CacheVersion.version + count)
+        )
+        if not result.rowcount:
+            db.execute(insert(CacheVersion).values(name=EMBEDDINGS_VERSION_KEY, version=count))
+        return self._get_embeddings_version(db)
+
+    def preload_embeddings(self, db: Session) -> None:
+        """Загрузить эмбеддинги в кэш поиска, если его нет или он отстал от БД
+
+        Кэш свой в каждом воркере: сравнение с общим счетчиком изменений - один
+        запрос по первичному ключу, а перезагрузка нужна только после изменений
+        в другом воркере.
+        """
+        # Версия читается до матрицы: изменения во время загрузки вызовут еще одну
+        version = self._get_embeddings_version(db)
+        if not _embedding_cache.loaded or _embedding_cache.version != version:
+            _embedding_cache.load(*self.get_active_embedding_matrix(db), version=version)
+
+    def save_vector_index(self) -> None:
+        """Сохранить индекс поиска по эмбеддингам"""
+        _embedding_cache.save_index()
 
 
 # Глобальный экземпляр сервиса
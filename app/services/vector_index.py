@@ -0,0 +1,147 @@
+import json
+from pathlib import Path
+from typing import List, Set, Tuple
+
+import numpy as np
+import structlog
+
+try:
+    import faiss
+except ImportError:  # faiss-cpu не установлен - поиск остается точным
+    faiss = None
+
+logger = structlog.get_logger()
+
+# Версия формата сохраненного индекса, при изменении индекс перестраивается
+INDEX_VERSION = 1
+
+
+class HNSWVectorIndex:
+    """Приближенный поиск ближайших эмбеддингов на HNSW графе FAISS
+
+    Хранит нормированные векторы, поэтому скалярное произведение равно
+    косинусному сходству. Метка вектора - ID фотографии. HNSW не
+    поддерживает удаление, поэтому удаленные фотографии помечаются и
+    пропускаются при поиске до следующей перестройки индекса.
+    """
+
+    def __init__(self, index_path: str, dim: int, m: int = 32, ef_search: int = 64):
+        self.index_path = Path(index_path)
+        self.meta_path = self.index_path.with_suffix('.json')
+        self.dim = dim
+        self.m = m
+        self.ef_search = ef_search
+        self._index = None
+        self._tombstones: Set[int] = set()
+
+    @property
+    def available(self) -> bool:
+        """Установлен ли faiss"""
+        return faiss is not None
+
+    @property
+    def built(self) -> bool:
+        """Построен ли индекс в памяти"""
+        return self._index is not None
+
+    def reset(self) -> None:
+        """Сбросить индекс в памяти"""
+        self._index = None
+        self._tombstones = set()
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _new_index(self):
+        index = faiss.IndexHNSWFlat(self.dim, self.m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efSearch = self.ef_search
+        return faiss.IndexIDMap2(index)
+
+    def build(self, photo_ids: np.ndarray, embeddings: np.ndarray) -> None:
+        """Построить индекс заново по эмбеддингам активных фотографий"""
+        index = self._new_index()
+        if len(photo_ids):
+            index.add_with_ids(self._normalize(embeddings), np.asarray(photo_ids, dtype=np.int64))
+        self._index = index
+        self._tombstones = set()
+        logger.info("Vector index built", size=len(photo_ids))
+
+    def load_or_build(self, photo_ids: np.ndarray, embeddings: np.ndarray) -> None:
+        """Загрузить индекс с диска, если он соответствует БД, иначе перестроить"""
+        if self._load(set(int(photo_id) for photo_id in photo_ids)):
+            return
+
+        self.build(photo_ids, embeddings)
+        self.save()
+
+    def _load(self, photo_ids: Set[int]) -> bool:
+        if not self.index_path.exists() or not self.meta_path.exists():
+            return False
+
+        try:
+            meta = json.loads(self.meta_path.read_text())
+            if meta.get('version') != INDEX_VERSION or meta.get('dim') != self.dim or meta.get('m') != self.m:
+                return False
+
+            index = faiss.read_index(str(self.index_path))
+            tombstones = set(meta.get('tombstones', []))
+            labels = set(faiss.vector_to_array(index.id_map).tolist())
+            if labels - tombstones != photo_ids:
+                logger.info("Vector index is out of date, rebuilding")
+                return False
+
+        except Exception as e:
+            logger.warning("Failed to load vector index", error=str(e))
+            return False
+
+        faiss.downcast_index(index.index).hnsw.efSearch = self.ef_search
+        self._index = index
+        self._tombstones = tombstones
+        logger.info("Vector index loaded", size=len(photo_ids))
+        return True
+
+    def save(self) -> None:
+        """Сохранить индекс и список удаленных меток на диск"""
+        if self._index is None:
+            return
+
+        try:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            faiss.write_index(self._index, str(self.index_path))
+            self.meta_path.write_text(json.dumps({
+                'version': INDEX_VERSION,
+                'dim': self.dim,
+                'm': self.m,
+                'tombstones': sorted(self._tombstones)
+            }))
+        except Exception as e:
+            logger.warning("Failed to save vector index", error=str(e))
+
+    def add(self, photo_id: int, embedding: np.ndarray) -> None:
+        """Добавить эмбеддинг фотографии"""
+        if photo_id in self._tombstones:
+            # ID удаленной фотографии занят повторно: старый вектор из графа
+            # не убрать, поэтому индекс будет перестроен при следующем поиске
+            self.reset()
+            return
+
+        self._index.add_with_ids(
+            self._normalize(np.asarray(embedding)[None, :]),
+            np.array([photo_id], dtype=np.int64)
+        )
+
+    def remove(self, photo_id: int) -> None:
+        """Пометить фотографию удаленной"""
+        self._tombstones.add(photo_id)
+
+    def search(self, target_embedding: np.ndarray, k: int = 5) -> List[Tuple[int, float]]:
+        """Найти k ближайших фотографий: [(photo_id, similarity)]"""
+        similarities, labels = self._index.search(self._normalize(np.asarray(target_embedding)[None, :]), k)
+        return [
+            (int(photo_id), float(similarity))
+            for photo_id, similarity in zip(labels[0], similarities[0])
+            if photo_id != -1 and int(photo_id) not in self._tombstones
+        ]
@@ -0,0 +1,93 @@
+import io
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Union
+
+# Формат записей стандартного logging (uvicorn, sqlalchemy и др.)
+STDLIB_LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+class BatchingQueueListener(QueueListener):
+    """Фоновый поток, записывающий накопленные строки лога пачками
+
+    В очередь попадают готовые байты structlog и записи стандартного logging.
+    Пока поток не запущен или очередь переполнена, запись идет в поток вывода
+    синхронно: очередь ограничена и не копит записи без читателя.
+    """
+
+    def __init__(self, log_queue: queue.Queue, stream: io.BufferedIOBase):
+        super().__init__(log_queue)
+        self.stream = stream
+        self.formatter = logging.Formatter(STDLIB_LOG_FORMAT)
+        self.running = False
+
+    def _write(self, record: Union[bytes, logging.LogRecord]) -> None:
+        if isinstance(record, logging.LogRecord):
+            record = (self.formatter.format(record) + "\n").encode("utf-8", "replace")
+        self.stream.write(record)
+
+    def enqueue(self, record: Union[bytes, logging.LogRecord]) -> None:
+        """Передать запись фоновому потоку или записать сразу"""
+        if self.running:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                pass
+        self._write(record)
+        self.stream.flush()
+
+    def handle(self, record: Union[bytes, logging.LogRecord]) -> None:
+        self._write(record)
+
+        # Сбрасываем буфер, только когда очередь опустела
+        if self.queue.empty():
+            self.stream.flush()
+
+    def enqueue_sentinel(self) -> None:
+        # Ожидаем место в ограниченной очереди: поток слушателя ее разбирает
+        self.queue.put(self._sentinel)
+
+    def start(self) -> None:
+        super().start()
+        self.running = True
+
+    def stop(self) -> None:
+        if not self.running:
+            return
+        self.running = False
+        super().stop()
+
+        # Записи, попавшие в очередь после маркера остановки
+        while True:
+            try:
+                self._write(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        self.stream.flush()
+
+
+class QueueStream:
+    """Файлоподобный объект для structlog, передающий строки лога слушателю"""
+
+    def __init__(self, listener: BatchingQueueListener):
+        self.listener = listener
+
+    def write(self, data: bytes) -> None:
+        self.listener.enqueue(data)
+
+    def flush(self) -> None:
+        # Сброс выполняет фоновый поток слушателя
+        pass
+
+
+class ListenerQueueHandler(QueueHandler):
+    """Обработчик стандартного logging, передающий записи слушателю"""
+
+    def __init__(self, listener: BatchingQueueListener):
+        super().__init__(listener.queue)
+        self.listener = listener
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        self.listener.enqueue(record)
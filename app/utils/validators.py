@@ -1,10 +1,44 @@
+import os
 import re
-from typing import List, Optional, Dict, Any
-from pathlib import Path
-import mimetypes
+import stat
+from typing import List, NamedTuple, Optional, Any, Tuple, Union
+
+import numpy as np
 
 from app.config.settings import settings
 
+# Разрешенные MIME типы изображений
+ALLOWED_MIME_TYPES = frozenset({'image/jpeg', 'image/jpg', 'image/png'})
+
+# MIME тип по расширению файла, вместо поиска по общей таблице mimetypes
+EXTENSION_MIME_TYPES = {'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'png': 'image/png'}
+
+# Шаблоны проверок, компилируются один раз при импорте
+INVALID_FILENAME_RE = re.compile(r'[<>:"/\\|?*]')
+INVALID_NAME_RE = re.compile(r'[<>"/\\|?*]')
+# Те же символы, что в классе [a-zA-Zа-яА-Я0-9]: проверка пересечения с множеством
+# прерывается на первом совпадении без запуска регулярного выражения
+NAME_ALNUM_CHARS = frozenset(
+    chr(code)
+    for start, end in (('0', '9'), ('a', 'z'), ('A', 'Z'), ('а', 'я'), ('А', 'Я'))
+    for code in range(ord(start), ord(end) + 1)
+)
+
+
+class ValidationResult(NamedTuple):
+    """Результат проверки: флаг валидности и сообщения об ошибках"""
+    is_valid: bool
+    errors: Tuple[str, ...]
+
+
+def get_file_extension(filename: str) -> str:
+    """Расширение файла в нижнем регистре без точки (точки в начале имени не считаются)"""
+    name = filename.rpartition('/')[2].lstrip('.')
+    dot = name.rfind('.')
+    if dot > 0:
+        return name[dot + 1:].lower()
+    return ''
+
 
 class FileValidator:
     """Валидатор для файлов"""
@@ -16,8 +50,7 @@ class FileValidator:
             return False
 
         # Проверка на недопустимые символы
-        invalid_chars = r'[<>:"/\\|?*]'
-        if re.search(invalid_chars, filename):
+        if INVALID_FILENAME_RE.search(filename):
             return False
 
         # Проверка длины
@@ -32,9 +65,7 @@ class FileValidator:
         if not filename:
             return False
 
-        extension = Path(filename).suffix.lower().lstrip('.')
-        allowed_extensions = settings.get_allowed_extensions_list()
-        return extension in allowed_extensions
+        return get_file_extension(filename) in settings.get_allowed_extensions_set()
 
     @staticmethod
     def validate_file_size(size: int) -> bool:
@@ -44,83 +75,63 @@ class FileValidator:
     @staticmethod
     def validate_mime_type(filename: str) -> bool:
         """Валидация MIME типа файла"""
-        mime_type, _ = mimetypes.guess_type(filename)
-        if not mime_type:
-            return False
-
-        allowed_mime_types = [
-            'image/jpeg',
-            'image/jpg',
-            'image/png'
-        ]
-
-        return mime_type.lower() in allowed_mime_types
+        return EXTENSION_MIME_TYPES.get(get_file_extension(filename)) in ALLOWED_MIME_TYPES
 
     @staticmethod
-    def validate_image_dimensions(width: int, height: int) -> Dict[str, Any]:
+    def validate_image_dimensions(width: int, height: int) -> ValidationResult:
         """Валидация размеров изображения"""
-        result = {
-            'is_valid': True,
-            'errors': []
-        }
+        errors = []
 
         # Минимальные размеры
         if width < 50 or height < 50:
-            result['is_valid'] = False
-            result['errors'].append('Изображение слишком маленькое (минимум 50x50 пикселей)')
+            errors.append('Изображение слишком маленькое (минимум 50x50 пикселей)')
 
         # Максимальные размеры
         if width > 5000 or height > 5000:
-            result['is_valid'] = False
-            result['errors'].append('Изображение слишком большое (максимум 5000x5000 пикселей)')
+            errors.append('Изображение слишком большое (максимум 5000x5000 пикселей)')
+
+        # Размеры вне допустимых делают изображение невалидным
+        is_valid = not errors
 
-        # Соотношение сторон
+        # Соотношение сторон - только предупреждение, на валидность не влияет
         if width > 0 and height > 0:
             aspect_ratio = max(width, height) / min(width, height)
             if aspect_ratio > 5.0:
-                result['errors'].append('Слишком большое соотношение сторон изображения')
+                errors.append('Слишком большое соотношение сторон изображения')
 
-        return result
+        return ValidationResult(is_valid, tuple(errors))
 
 
 class PersonValidator:
     """Валидатор для данных о людях"""
 
     @staticmethod
-    def validate_person_name(name: str) -> Dict[str, Any]:
+    def validate_person_name(name: str) -> ValidationResult:
         """Валидация имени человека"""
-        result = {
-            'is_valid': True,
-            'errors': []
-        }
+        errors = []
 
         if not name or len(name.strip()) == 0:
-            result['is_valid'] = False
-            result['errors'].append('Имя не может быть пустым')
-            return result
+            errors.append('Имя не может быть пустым')
+            return ValidationResult(False, tuple(errors))
 
         name = name.strip()
 
         # Проверка длины
         if len(name) < 2:
-            result['is_valid'] = False
-            result['errors'].append('Имя слишком короткое (минимум 2 символа)')
+            errors.append('Имя слишком короткое (минимум 2 символа)')
 
         if len(name) > 255:
-            result['is_valid'] = False
-            result['errors'].append('Имя слишком длинное (максимум 255 символов)')
+            errors.append('Имя слишком длинное (максимум 255 символов)')
 
         # Проверка на недопустимые символы
-        if re.search(r'[<>"/\\|?*]', name):
-            result['is_valid'] = False
-            result['errors'].append('Имя содержит недопустимые символы')
+        if INVALID_NAME_RE.search(name):
+            errors.append('Имя содержит недопустимые символы')
 
         # Проверка на только пробелы и специальные символы
-        if not re.search(r'[a-zA-Zа-яА-Я0-9]', name):
-            result['is_valid'] = False
-            result['errors'].append('Имя должно содержать буквы или цифры')
+        if NAME_ALNUM_CHARS.isdisjoint(name):
+            errors.append('Имя должно содержать буквы или цифры')
 
-        return result
+        return ValidationResult(not errors, tuple(errors))
 
     @staticmethod
     def validate_person_id(person_id: Any) -> bool:
@@ -146,122 +157,102 @@ class FaceRecognitionValidator:
         return 0.0 <= confidence <= 1.0
 
     @staticmethod
-    def validate_embedding_vector(embedding: List[float]) -> Dict[str, Any]:
+    def validate_embedding_vector(embedding: Union[List[float], np.ndarray]) -> ValidationResult:
         """Валидация вектора эмбеддинга"""
-        result = {
-            'is_valid': True,
-            'errors': []
-        }
+        errors = []
+
+        if embedding is None or len(embedding) == 0:
+            errors.append('Вектор эмбеддинга пустой')
+            return ValidationResult(False, tuple(errors))
 
-        if not embedding:
-            result['is_valid'] = False
-            result['errors'].append('Вектор эмбеддинга пустой')
-            return result
+        try:
+            values = np.asarray(embedding)
+        except Exception as e:
+            errors.append(f'Ошибка при валидации вектора: {str(e)}')
+            return ValidationResult(False, tuple(errors))
 
         # Проверка размерности (InsightFace buffalo_l = 512)
         expected_dim = 512
-        if len(embedding) != expected_dim:
-            result['is_valid'] = False
-            result['errors'].append(
+        if values.shape != (expected_dim,):
+            errors.append(
                 f'Неверная размерность вектора. Ожидается: {expected_dim}, получено: {len(embedding)}'
             )
 
-        # Проверка на валидные значения
-        try:
-            for i, val in enumerate(embedding):
-                if not isinstance(val, (int, float)):
-                    result['is_valid'] = False
-                    result['errors'].append(f'Некорректное значение в позиции {i}: {val}')
-                    break
-
-                # Проверка на NaN и бесконечность
-                if val != val or abs(val) == float('inf'):
-                    result['is_valid'] = False
-                    result['errors'].append(f'Некорректное значение в позиции {i}: {val}')
-                    break
+        # Строки, None и прочие объекты дают нечисловой dtype
+        if values.dtype.kind not in 'biuf':
+            errors.append('Вектор содержит нечисловые значения')
+            return ValidationResult(False, tuple(errors))
 
-        except Exception as e:
-            result['is_valid'] = False
-            result['errors'].append(f'Ошибка при валидации вектора: {str(e)}')
+        # Проверка на NaN и бесконечность одним проходом по массиву,
+        # позиция ищется только для невалидного вектора
+        finite = np.isfinite(values)
+        if not finite.all():
+            i = int(np.argmin(finite.ravel()))
+            errors.append(f'Некорректное значение в позиции {i}: {values.ravel()[i]}')
 
-        return result
+        return ValidationResult(not errors, tuple(errors))
 
 
 def validate_upload_request(
     filename: Optional[str],
     file_size: Optional[int],
     person_id: Optional[int] = None
-) -> Dict[str, Any]:
+) -> ValidationResult:
     """Комплексная валидация запроса на загрузку файла"""
-    result = {
-        'is_valid': True,
-        'errors': []
-    }
+    errors = []
 
-    # Валидация имени файла
+    # Валидация имени файла; для некорректного имени расширение не проверяется
     if not filename:
-        result['is_valid'] = False
-        result['errors'].append('Имя файла не указано')
+        errors.append('Имя файла не указано')
+    elif not FileValidator.validate_filename(filename):
+        errors.append('Некорректное имя файла')
     else:
-        if not FileValidator.validate_filename(filename):
-            result['is_valid'] = False
-            result['errors'].append('Некорректное имя файла')
-
-        if not FileValidator.validate_file_extension(filename):
-            result['is_valid'] = False
+        # Расширение разбирается один раз для проверки и расширения, и MIME типа
+        extension = get_file_extension(filename)
+        if extension not in settings.get_allowed_extensions_set():
             allowed_extensions = settings.get_allowed_extensions_list()
-            result['errors'].append(
+            errors.append(
                 f'Неподдерживаемое расширение файла. Разрешены: {", ".join(allowed_extensions)}'
             )
 
-        if not FileValidator.validate_mime_type(filename):
-            result['is_valid'] = False
-            result['errors'].append('Неподдерживаемый тип файла')
+        if EXTENSION_MIME_TYPES.get(extension) not in ALLOWED_MIME_TYPES:
+            errors.append('Неподдерживаемый тип файла')
 
     # Валидация размера файла
     if file_size is None:
-        result['is_valid'] = False
-        result['errors'].append('Размер файла не указан')
+        errors.append('Размер файла не указан')
     elif not FileValidator.validate_file_size(file_size):
         max_size_mb = settings.max_upload_size / (1024 * 1024)
-        result['is_valid'] = False
-        result['errors'].append(f'Файл слишком большой. Максимальный размер: {max_size_mb:.1f} MB')
+        errors.append(f'Файл слишком большой. Максимальный размер: {max_size_mb:.1f} MB')
 
     # Валидация ID человека (если указан)
     if person_id is not None and not PersonValidator.validate_person_id(person_id):
-        result['is_valid'] = False
-        result['errors'].append('Некорректный ID человека')
+        errors.append('Некорректный ID человека')
 
-    return result
+    return ValidationResult(not errors, tuple(errors))
 
 
-def validate_identification_request(image_path: str) -> Dict[str, Any]:
+def validate_identification_request(image_path: str) -> ValidationResult:
     """Валидация запроса на идентификацию"""
-    result = {
-        'is_valid': True,
-        'errors': []
-    }
+    errors = []
 
     if not image_path:
-        result['is_valid'] = False
-        result['errors'].append('Путь к изображению не указан')
-        return result
-
-    path = Path(image_path)
+        errors.append('Путь к изображению не указан')
+        return ValidationResult(False, tuple(errors))
 
-    if not path.exists():
-        result['is_valid'] = False
-        result['errors'].append('Файл изображения не найден')
-        return result
+    # Один вызов stat вместо отдельных exists() и is_file()
+    try:
+        file_stat = os.stat(image_path)
+    except OSError:
+        errors.append('Файл изображения не найден')
+        return ValidationResult(False, tuple(errors))
 
-    if not path.is_file():
-        result['is_valid'] = False
-        result['errors'].append('Указанный путь не является файлом')
-        return result
+    if not stat.S_ISREG(file_stat.st_mode):
+        errors.append('Указанный путь не является файлом')
+        return ValidationResult(False, tuple(errors))
 
     # Проверка расширения
-    if not FileValidator.validate_file_extension(path.name):
-        result['is_valid'] = False
-        result['errors'].append('Неподдерживаемый формат изображения')
+    if not FileValidator.validate_file_extension(os.path.basename(image_path)):
+        errors.append('Неподдерживаемый формат изображения')
 
-    return result
\ No newline at end of file
+    return ValidationResult(not errors, tuple(errors))
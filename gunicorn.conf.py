@@ -0,0 +1,36 @@
+"""
+Конфигурация Gunicorn для продакшена
+
+Приложение импортируется в мастер-процессе (preload_app), там же загружается
+модель InsightFace. Воркеры получают ее через fork: страницы с весами ONNX
+разделяются между процессами по copy-on-write, и каждый воркер не держит
+свою копию модели и не тратит секунды на ее загрузку.
+
+Запуск: gunicorn -c gunicorn.conf.py app.main:app
+"""
+import os
+
+from app.config.settings import settings
+
+bind = f"{settings.app_host}:{settings.app_port}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = 300
+preload_app = True
+
+
+def when_ready(server):
+    """Загрузить модель в мастер-процессе до запуска воркеров"""
+    from app.main import log_listener
+    from app.services.face_service import face_service
+
+    if not settings.preload_face_model or not face_service.is_fork_safe():
+        return
+
+    # Поток записи логов запускается только на время загрузки: записи,
+    # оставшиеся в очереди, иначе скопировались бы в каждый воркер
+    log_listener.start()
+    try:
+        face_service.initialize()
+    finally:
+        log_listener.stop()
@@ -4,6 +4,12 @@
 """
 import os
 import sys
+
+# Переменные окружения для ONNX задаются до импорта модулей приложения,
+# чтобы они действовали при любой ранней инициализации библиотек
+os.environ['OMP_NUM_THREADS'] = '1'
+os.environ['ONNX_NUM_THREADS'] = '1'
+
 import uvicorn
 from pathlib import Path
 
@@ -24,8 +30,10 @@ def main():
         Path("templates")
     ]
 
+    # Обычно директории уже существуют: достаточно одного stat без попытки mkdir
     for directory in required_dirs:
-        directory.mkdir(parents=True, exist_ok=True)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
 
     print("🚀 Запуск Face Recognition System...")
     print(f"📍 Адрес: http://{settings.app_host}:{settings.app_port}")
@@ -33,9 +41,7 @@ def main():
     print(f"📊 База данных: {settings.database_url}")
     print(f"🎯 Порог распознавания: {settings.face_recognition_threshold}")
 
-    # Устанавливаем переменные окружения для ONNX
-    os.environ['OMP_NUM_THREADS'] = '1'
-    os.environ['ONNX_NUM_THREADS'] = '1'
+    # Путь к моделям InsightFace известен только после загрузки настроек
     os.environ['INSIGHTFACE_ROOT'] = settings.models_cache_path
 
     try: